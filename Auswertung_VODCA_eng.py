@@ -4,16 +4,37 @@ import pandas as pd
 import glob
 import matplotlib.pyplot as plt
 import ast
+import json
+import pickle
+import hashlib
+import warnings
+from statistics import NormalDist
+from concurrent.futures import ThreadPoolExecutor
+import Results_VODCA_eng
 
 
-def data_evaluation(path, **kwargs):
+def data_evaluation(path, incremental=False, workers=4, uncertainty=None, n_resamples=10000, confidence=0.95,
+                    **kwargs):
     """
     evaluates the data
 
     Parameters
     ----------
-    path : str
-        path to the evaluated folder
+    path : str or list
+        path to the evaluated folder, a list of folders (e.g. several campaigns) is evaluated as one dataset,
+        the results are saved in the first folder
+    incremental : bool, optional
+        if True the read result files are cached in evaluation_cache_<name>.pkl in every folder and only new or
+        changed files are read again. The default is False.
+    workers : int, optional
+        number of threads reading the new or changed files in the incremental mode. The default is 4.
+    uncertainty : str, optional
+        'bootstrap' or 'binomial' adds confidence intervals of the frozen fraction and Nm, see
+        calculate_confidence_intervals. None calculates only the values. The default is None.
+    n_resamples : int, optional
+        number of resamples of the bootstrap. The default is 10000.
+    confidence : float, optional
+        confidence level of the intervals. The default is 0.95.
     **kwargs : TYPE
         optional arguments for the calculation of Nm
 
@@ -21,19 +42,19 @@ def data_evaluation(path, **kwargs):
     -------
     gesamtdaten_Nm : dataframe
     'temperature', 'number of frozen droplets', 'radius frozen droplets', 'sum of already frozen droplets', 'frozen_fraction, 'Nm'
+    and with uncertainty 'frozen_fraction_lower', 'frozen_fraction_upper', 'Nm_lower', 'Nm_upper'
 
     """
-
-    csv_dateien = glob.glob(os.path.join(path, "*.csv"))
+    paths = [path] if isinstance(path, str) else list(path)
     dataframes = []
+    for directory in paths:
+        if incremental:
+            dataframes.extend(read_results_incremental(directory, workers))
+        else:
+            dataframes.extend(read_results(datei) for datei in result_files(directory))
 
-
-    for datei in csv_dateien:
-
-        if 'droplets_' in datei:
-            df = pd.read_csv(datei, header='infer', sep=',')
-            dataframes.append(df)
-            df = pd.concat(dataframes)
+    # the results of all folders are merged at once
+    df = pd.concat(dataframes)
 
     df = df.sort_values(by="temperature")
     df.set_index('temperature', inplace=False)
@@ -41,15 +62,193 @@ def data_evaluation(path, **kwargs):
     df_ff = calculate_frozen_fraction(df_af)
 
     gesamtdaten_Nm = calculate_Nm(df_ff, **kwargs)
+    if uncertainty is not None:
+        gesamtdaten_Nm = calculate_confidence_intervals(gesamtdaten_Nm, method=uncertainty, n_resamples=n_resamples,
+                                                        confidence=confidence, **kwargs)
     save_path = os.path.join(
-        path, f'overall_evaluation_{os.path.basename(path)}.csv')
+        paths[0], f'overall_evaluation_{os.path.basename(paths[0])}.csv')
     gesamtdaten_Nm.to_csv(save_path, index=False)
 
-    plot_Nm(gesamtdaten_Nm, path)
+    plot_Nm(gesamtdaten_Nm, paths[0])
 
     return gesamtdaten_Nm
 
 
+def result_files(path):
+    """
+    finds the result files of all subfolders, if there is a npz file of a folder it is read instead of the csv file
+
+    Parameters
+    ----------
+    path : str
+        path to the evaluated folder
+
+    Returns
+    -------
+    dateien : list
+        paths to the droplets_<name>.csv and droplets_<name>.npz files
+
+    """
+    csv_dateien = glob.glob(os.path.join(path, "*.csv")) + glob.glob(os.path.join(path, "*.npz"))
+    return sorted(datei for datei in csv_dateien
+                  if os.path.basename(datei).startswith('droplets_')
+                  and not (datei.endswith('.csv') and os.path.exists(datei[:-4] + '.npz')))
+
+
+def evaluation_cache_paths(path):
+    name = os.path.basename(os.path.normpath(path))
+    return (os.path.join(path, f'evaluation_manifest_{name}.json'),
+            os.path.join(path, f'evaluation_cache_{name}.pkl'))
+
+
+def read_results_incremental(path, workers=4):
+    """
+    reads the result files of a folder, files which did not change since the last evaluation are taken from the cache
+
+    the manifest evaluation_manifest_<name>.json contains the modification time, size and sha1 hash of every file
+    and the version of pandas, the read dataframes are cached in evaluation_cache_<name>.pkl. Both are files
+    in the folder, so the cache is not taken for a subfolder with images.
+
+    Parameters
+    ----------
+    path : str
+        path to the evaluated folder
+    workers : int, optional
+        number of threads reading the new or changed files. The default is 4.
+
+    Returns
+    -------
+    dataframes : list
+        one dataframe per result file, see read_results
+
+    """
+    manifest_path, cache_path = evaluation_cache_paths(path)
+    remove_old_evaluation_cache(path)
+
+    # pickled dataframes can not always be read by another version of pandas, so the cache is not used then
+    files = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as file:
+            manifest = json.load(file)
+        if manifest.get('pandas') == pd.__version__:
+            files = manifest.get('files', {})
+    cache = {}
+    if files and os.path.exists(cache_path):
+        with open(cache_path, 'rb') as file:
+            cache = pickle.load(file)
+
+    dateien = result_files(path)
+    new_files = {}
+    changed = []
+    for datei in dateien:
+        name = os.path.basename(datei)
+        stat = os.stat(datei)
+        entry = {'mtime': stat.st_mtime_ns, 'size': stat.st_size}
+        saved = files.get(name)
+        if saved is not None and name in cache:
+            # the hash is only computed if the modification time or size changed
+            if saved['mtime'] == entry['mtime'] and saved['size'] == entry['size']:
+                new_files[name] = saved
+                continue
+            entry['sha1'] = file_hash(datei)
+            if saved['sha1'] == entry['sha1']:
+                new_files[name] = entry
+                continue
+        else:
+            entry['sha1'] = file_hash(datei)
+        new_files[name] = entry
+        changed.append(datei)
+
+    if changed:
+        print(f'{len(changed)} of {len(dateien)} result files in {path} are read')
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            cache.update(zip([os.path.basename(datei) for datei in changed], executor.map(read_results, changed)))
+
+    # result files which were deleted are removed from the cache
+    cache = {name: cache[name] for name in new_files}
+    if changed or len(cache) != len(files):
+        with open(cache_path, 'wb') as file:
+            pickle.dump(cache, file)
+    with open(manifest_path, 'w') as file:
+        json.dump({'pandas': pd.__version__, 'files': new_files}, file, indent=4)
+
+    return [cache[os.path.basename(datei)] for datei in dateien]
+
+
+def file_hash(datei):
+    # sha1 of the content like Cache_VODCA_eng.image_hash, which is not imported because it needs cv2
+    sha1 = hashlib.sha1()
+    with open(datei, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def remove_old_evaluation_cache(path):
+    """
+    removes the subfolder evaluation_cache of earlier versions, it was taken for a subfolder with images
+    """
+    directory = os.path.join(path, 'evaluation_cache')
+    if not os.path.isdir(directory):
+        return
+    names = os.listdir(directory)
+    if all(name == 'manifest.json' or name.endswith('.pkl') for name in names):
+        for name in names:
+            os.remove(os.path.join(directory, name))
+        os.rmdir(directory)
+
+
+def read_results(datei):
+    """
+    reads the results of one folder, either the csv file or the npz file
+
+    Parameters
+    ----------
+    datei : str
+        path to droplets_<name>.csv or droplets_<name>.npz
+
+    Returns
+    -------
+    df : dataframe
+        'temperature', 'number of frozen droplets', 'radius frozen droplets'
+        (for npz files the radii are numpy arrays instead of strings)
+
+    """
+    if datei.endswith('.npz'):
+        temperatures, n_frozen, radii = Results_VODCA_eng.read_npz(datei)
+        return pd.DataFrame({'temperature': temperatures,
+                             'number of frozen droplets': n_frozen,
+                             'radius frozen droplets': radii})
+    return pd.read_csv(datei, header='infer', sep=',')
+
+
+def evaluate_rows(rows, total_number_of_droplets, **kwargs):
+    """
+    evaluates the rows of an analysis which is still running
+
+    Parameters
+    ----------
+    rows : list
+        rows of the csv file: temperature, number of frozen droplets, radius frozen droplets
+    total_number_of_droplets : int
+        number of all evaluated droplets, including the ones which are still liquid
+    **kwargs : TYPE
+        optional arguments for the calculation of Nm
+
+    Returns
+    -------
+    gesamtdaten_Nm : dataframe
+    'temperature', 'number of frozen droplets', 'radius frozen droplets', 'sum of already frozen droplets', 'frozen_fraction, 'Nm'
+
+    """
+    df = pd.DataFrame(rows, columns=['temperature', 'number of frozen droplets', 'radius frozen droplets'])
+    df = df.astype({'temperature': float, 'number of frozen droplets': int})
+    df = df.sort_values(by="temperature")
+    df_af = calculate_already_frozen(df)
+    df_ff = calculate_frozen_fraction(df_af, total_number_of_droplets)
+    return calculate_Nm(df_ff, **kwargs)
+
+
 def calculate_already_frozen(gesamtdaten):
     """
     sums up the number of frozen droplets
@@ -65,16 +264,9 @@ def calculate_already_frozen(gesamtdaten):
         'temperature', 'number of frozen droplets', 'radius frozen droplets', 'sum of already frozen droplets'
 
     """
-    already_frozen_df = pd.DataFrame()
-    already_frozen_list = []
-    for i in range(len(gesamtdaten)):
-        dasisteineSerie = gesamtdaten.iloc[0:i+1, 1].sum()
-        already_frozen_list.append(dasisteineSerie)
-
-    already_frozen_df['Already_frozen'] = already_frozen_list
-    already_frozen_df.index = gesamtdaten.index
-    gesamtdaten = gesamtdaten.assign(
-        Already_frozen=already_frozen_df['Already_frozen'])
+    # cumulative sum of the number of frozen droplets, the rows are counted by position and not by index
+    already_frozen = gesamtdaten.iloc[:, 1].cumsum().to_numpy()
+    gesamtdaten = gesamtdaten.assign(Already_frozen=already_frozen)
 
     return gesamtdaten
 
@@ -103,7 +295,7 @@ def runden_sig_stellen(liste, sig=2):
         return np.round(liste * factor) / factor
 
 
-def calculate_frozen_fraction(gesamtdaten_af):
+def calculate_frozen_fraction(gesamtdaten_af, total_number_of_droplets=None):
     """
     calculates the frozen fraction
 
@@ -111,6 +303,8 @@ def calculate_frozen_fraction(gesamtdaten_af):
     ----------
     gesamtdaten_af : dataframe
         'temperature', 'number of frozen droplets', 'radius frozen droplets', 'sum of already frozen droplets'
+    total_number_of_droplets : int, optional
+        number of all droplets, None assumes that all droplets are frozen at the end. The default is None.
 
     Returns
     -------
@@ -119,22 +313,12 @@ def calculate_frozen_fraction(gesamtdaten_af):
 
     """
 
-    frozen_fraction_df = pd.DataFrame()
-    frozen_fraction_list = []
-    last_index = len(gesamtdaten_af)
-    total_number_of_droplets = gesamtdaten_af.iloc[last_index-1, 3]
-
-    for i in range(len(gesamtdaten_af)):
-
-        frozen_fraction_list.append(
-            gesamtdaten_af.iloc[i, 3]/total_number_of_droplets)
-
-    frozen_fraction_list = runden_sig_stellen(frozen_fraction_list, 4)
-    frozen_fraction_df['Frozen_Fraction'] = frozen_fraction_list
-    frozen_fraction_df.index = gesamtdaten_af.index
+    already_frozen = gesamtdaten_af.iloc[:, 3].to_numpy()
+    if total_number_of_droplets is None:
+        total_number_of_droplets = already_frozen[-1]
 
-    gesamtdaten_ff = gesamtdaten_af.assign(
-        frozen_fraction=frozen_fraction_df['Frozen_Fraction'])
+    frozen_fraction = runden_sig_stellen(already_frozen/total_number_of_droplets, 4)
+    gesamtdaten_ff = gesamtdaten_af.assign(frozen_fraction=frozen_fraction)
 
     return gesamtdaten_ff
 
@@ -163,34 +347,223 @@ def calculate_Nm(gesamtdaten, d=1, a=1, b=1, V_method='mean'):
 
     """
 
-    Nm_df = pd.DataFrame()
-    Nm_list = []
+    frozen_fraction = gesamtdaten.iloc[:, 4].to_numpy(dtype=float)
+    not_all_frozen = frozen_fraction != 1
+    Nm = np.zeros(len(gesamtdaten))
 
-    for i in range(len(gesamtdaten)):
-        if gesamtdaten.iloc[i, 4] != 1:
-            if V_method == 'individually':
-                V = calculate_volume(gesamtdaten.iloc[i, 2])
-            if V_method == 'mean':
-                V = calculate_volume_with_mean(gesamtdaten)
-            Nm_list.append(-np.log(1-gesamtdaten.iloc[i, 4])*(d*a)/(V*b))
-        else:
-            Nm_list.append(0)
-    Nm_list = runden_sig_stellen(Nm_list, 4)
-    Nm_df['Nm'] = Nm_list
-    Nm_df.index = gesamtdaten.index
+    if not_all_frozen.any():
+        V = droplet_volume(gesamtdaten, not_all_frozen, V_method)
+        Nm[not_all_frozen] = -np.log(1-frozen_fraction[not_all_frozen])*(d*a)/(V*b)
 
-    gesamtdaten_Nm = gesamtdaten.assign(Nm=Nm_df['Nm'])
+    Nm = runden_sig_stellen(Nm, 4)
+    gesamtdaten_Nm = gesamtdaten.assign(Nm=Nm)
     return gesamtdaten_Nm
 
 
+def droplet_volume(gesamtdaten, rows, V_method='mean'):
+    """
+    calculates the volume used for Nm
+
+    Parameters
+    ----------
+    gesamtdaten : dataframe
+        'temperature', 'number of frozen droplets', 'radius frozen droplets', ...
+    rows : numpy array
+        bool mask of the rows the volume is needed for
+    V_method : str, optional
+        'individually' or 'mean'. The default is 'mean'.
+
+    Returns
+    -------
+    V : float or numpy array
+        mean volume of all droplets or volume of the droplets of every row
+
+    """
+    if V_method == 'individually':
+        return gesamtdaten.iloc[:, 2][rows].apply(calculate_volume).to_numpy(dtype=float)
+    if V_method == 'mean':
+        # the mean volume is the same for all rows, so it is only calculated once
+        return calculate_volume_with_mean(gesamtdaten)
+    raise ValueError(f"V_method has to be 'individually' or 'mean', not {V_method!r}")
+
+
+def calculate_confidence_intervals(gesamtdaten_Nm, method='bootstrap', n_resamples=10000, confidence=0.95,
+                                   total_number_of_droplets=None, seed=None, d=1, a=1, b=1, V_method='mean'):
+    """
+    calculates confidence intervals of the frozen fraction and Nm
+
+    'bootstrap' resamples whole droplets (the step they froze in and their radius) with replacement and
+    calculates the frozen fraction, the volume and Nm of every resample, so the intervals of Nm include the
+    uncertainty of the droplet size, see bootstrap_intervals.
+    'binomial' is the Wilson score interval of the frozen fraction at every temperature, the number of already
+    frozen droplets is binomial distributed. Nm increases with the frozen fraction, so its interval follows from
+    the interval of the frozen fraction with the volume of the data.
+
+    Parameters
+    ----------
+    gesamtdaten_Nm : dataframe
+        'temperature', 'number of frozen droplets', 'radius frozen droplets', 'sum of already frozen droplets', 'frozen_fraction, 'Nm'
+    method : str, optional
+        'bootstrap' or 'binomial'. The default is 'bootstrap'.
+    n_resamples : int, optional
+        number of resamples of the bootstrap. The default is 10000.
+    confidence : float, optional
+        confidence level of the intervals. The default is 0.95.
+    total_number_of_droplets : int, optional
+        number of all droplets, None assumes that all droplets are frozen at the end. The default is None.
+    seed : int, optional
+        seed of the random number generator of the bootstrap. The default is None.
+    d, a, b, V_method : optional
+        arguments of calculate_Nm
+
+    Returns
+    -------
+    gesamtdaten_Nm : dataframe
+        with the columns 'frozen_fraction_lower', 'frozen_fraction_upper', 'Nm_lower', 'Nm_upper'
+
+    """
+    frozen = gesamtdaten_Nm.iloc[:, 1].to_numpy(dtype=np.int64)
+    already_frozen = gesamtdaten_Nm.iloc[:, 3].to_numpy(dtype=np.int64)
+    if total_number_of_droplets is None:
+        total_number_of_droplets = already_frozen[-1]
+    alpha = (1 - confidence) / 2
+
+    if method == 'bootstrap':
+        lower, upper, Nm_bounds = bootstrap_intervals(gesamtdaten_Nm, total_number_of_droplets, n_resamples, alpha,
+                                                      np.random.default_rng(seed), d, a, b, V_method)
+    elif method == 'binomial':
+        lower, upper = wilson_interval(already_frozen, total_number_of_droplets, alpha)
+
+        # Nm is not defined for a frozen fraction of 1 (and for rows without frozen droplets with V_method='individually')
+        Nm_bounds = np.full((2, len(gesamtdaten_Nm)), np.nan)
+        rows = lower != 1
+        if V_method == 'individually':
+            rows &= frozen > 0
+        if rows.any():
+            V = droplet_volume(gesamtdaten_Nm, rows, V_method)
+            with np.errstate(divide='ignore'):
+                Nm_bounds[:, rows] = -np.log(1-np.array([lower, upper])[:, rows])*(d*a)/(V*b)
+    else:
+        raise ValueError(f"method has to be 'bootstrap' or 'binomial', not {method!r}")
+    Nm_bounds[1, upper == 1] = np.nan
+
+    # runden_sig_stellen returns nan for 0, the lower bounds are often 0 at the warmest temperatures
+    def runden(liste):
+        return np.where(liste == 0, 0.0, runden_sig_stellen(liste, 4))
+
+    return gesamtdaten_Nm.assign(frozen_fraction_lower=runden(lower), frozen_fraction_upper=runden(upper),
+                                 Nm_lower=runden(Nm_bounds[0]), Nm_upper=runden(Nm_bounds[1]))
+
+
+def wilson_interval(already_frozen, total_number_of_droplets, alpha):
+    """
+    Wilson score interval of the frozen fraction, it stays inside of [0, 1] and keeps its confidence level
+    for few droplets and frozen fractions close to 0 or 1
+
+    Returns
+    -------
+    lower, upper : numpy array
+        bounds of the frozen fraction at every temperature
+
+    """
+    n = total_number_of_droplets
+    p = np.asarray(already_frozen, dtype=float) / n
+    z = NormalDist().inv_cdf(1 - alpha)
+    denominator = 1 + z**2/n
+    centre = (p + z**2/(2*n)) / denominator
+    half_width = z * np.sqrt(p*(1-p)/n + z**2/(4*n**2)) / denominator
+    lower = np.clip(centre - half_width, 0, 1)
+    upper = np.clip(centre + half_width, 0, 1)
+    # the bounds of 0 and n frozen droplets are exactly 0 and 1
+    lower[p == 0] = 0
+    upper[p == 1] = 1
+    return lower, upper
+
+
+def droplet_radii(entry, n):
+    """
+    radii of the n droplets of a row, as saved in the csv file or as array from the npz file
+    """
+    if isinstance(entry, str):
+        radii = np.array([radius for radius in entry.strip('[]').split() if radius != '...'], dtype=float)
+    else:
+        radii = np.asarray(entry, dtype=float).ravel()
+    if len(radii) != n:
+        # numpy shortens the string of long arrays, the missing radii are filled up with the saved ones
+        radii = np.resize(radii, n)
+    return radii
+
+
+def bootstrap_intervals(gesamtdaten_Nm, total_number_of_droplets, n_resamples, alpha, rng, d=1, a=1, b=1,
+                        V_method='mean'):
+    """
+    bootstrap of whole droplets: every resample draws the droplets with replacement, each with the step it froze in
+    (or liquid) and its radius, and calculates the frozen fraction and Nm with the volume of the resample
+    like calculate_Nm. The resamples are drawn in chunks, so the memory stays bounded for many droplets.
+
+    Returns
+    -------
+    lower, upper : numpy array
+        bounds of the frozen fraction at every temperature
+    Nm_bounds : numpy array
+        2 x temperatures, lower and upper bounds of Nm, nan where Nm is not defined
+
+    """
+    if V_method not in ('mean', 'individually'):
+        raise ValueError(f"V_method has to be 'individually' or 'mean', not {V_method!r}")
+    frozen = gesamtdaten_Nm.iloc[:, 1].to_numpy(dtype=np.int64)
+    n_steps = len(frozen)
+    n = int(total_number_of_droplets)
+
+    # one entry per droplet, the droplets which did not freeze get the step n_steps and no radius
+    steps = np.repeat(np.arange(n_steps), frozen)
+    radius = np.concatenate([droplet_radii(entry, count) for entry, count
+                             in zip(gesamtdaten_Nm.iloc[:, 2], frozen)] + [np.zeros(0)])
+    steps = np.append(steps, np.full(n - len(steps), n_steps))
+    radius = np.append(radius, np.zeros(n - len(radius)))
+
+    fractions, Nms = [], []
+    chunk_size = max(1, 10**6 // n)
+    for start in range(0, n_resamples, chunk_size):
+        size = min(chunk_size, n_resamples - start)
+        drawn = rng.integers(0, n, size=(size, n))
+        bins = (np.arange(size)[:, np.newaxis] * (n_steps + 1) + steps[drawn]).ravel()
+        counts = np.bincount(bins, minlength=size * (n_steps + 1)).reshape(size, n_steps + 1)[:, :-1]
+        radius_sums = np.bincount(bins, weights=radius[drawn].ravel(),
+                                  minlength=size * (n_steps + 1)).reshape(size, n_steps + 1)[:, :-1]
+        fraction = counts.cumsum(axis=1) / n
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if V_method == 'mean':
+                # like calculate_volume_with_mean: mean of the sums of the radii of the rows,
+                # rows without droplets in the resample count with a sum of 0
+                r = radius_sums.mean(axis=1, keepdims=True)
+            else:
+                # like calculate_volume: mean radius of the droplets of every row, rows without droplets are nan
+                r = radius_sums / counts
+            V = ((r/1000000)**3) * 4*np.pi/3
+            Nm = -np.log(1-fraction)*(d*a)/(V*b)
+        Nm[(fraction == 1) | ~np.isfinite(Nm)] = np.nan
+        fractions.append(fraction)
+        Nms.append(Nm)
+
+    fractions = np.concatenate(fractions)
+    lower, upper = np.quantile(fractions, [alpha, 1 - alpha], axis=0)
+    # temperatures without any defined Nm (e.g. all resamples frozen) get nan
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        Nm_bounds = np.nanquantile(np.concatenate(Nms), [alpha, 1 - alpha], axis=0)
+    return lower, upper, Nm_bounds
+
+
 def calculate_volume(gesamtdaten_ausschnitt):
     """
     calculates the volume of the individual droplets
 
     Parameters
     ----------
-    gesamtdaten_ausschnitt : int
-        radius of the droplet
+    gesamtdaten_ausschnitt : str or numpy array
+        radii of the droplets, as saved in the csv file or as array from the npz file
 
     Returns
     -------
@@ -199,6 +572,10 @@ def calculate_volume(gesamtdaten_ausschnitt):
 
     """
 
+    if not isinstance(gesamtdaten_ausschnitt, str):
+        r = np.mean(gesamtdaten_ausschnitt)
+        return ((r/1000000)**3) * 4*np.pi/3
+
     radii_list = gesamtdaten_ausschnitt[2:-2]
     radii_list = radii_list.split(' ')
     radii_list_int = []
@@ -219,8 +596,8 @@ def sum_list_elements(string):
 
     Parameters
     ----------
-    string : str
-
+    string : str or numpy array
+        radii as saved in the csv file or as array from the npz file
 
     Returns
     -------
@@ -228,6 +605,8 @@ def sum_list_elements(string):
             sum of elements of the list
 
     """
+    if not isinstance(string, str):
+        return sum(string)
     try:
         # replaces whitespaces with ','
         string = string.replace(" ", ",")
@@ -283,6 +662,10 @@ def plot_Nm(gesamtdaten_Nm, path):
 
     """
     plt.plot(-gesamtdaten_Nm.iloc[:, 0], gesamtdaten_Nm.iloc[:, 5], 'o')
+    if 'Nm_lower' in gesamtdaten_Nm.columns:
+        # confidence interval, see calculate_confidence_intervals
+        plt.fill_between(-gesamtdaten_Nm.iloc[:, 0], gesamtdaten_Nm['Nm_lower'], gesamtdaten_Nm['Nm_upper'],
+                         alpha=0.3, linewidth=0)
     plt.yscale('log')
     plt.ylabel('Nm')
     plt.xlabel('temperature in °C')
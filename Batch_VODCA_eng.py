@@ -0,0 +1,249 @@
+import os
+import sys
+import contextlib
+import importlib.util
+import traceback
+import numpy as np
+import Cache_VODCA_eng
+import Frames_VODCA_eng
+import Droplets_VODCA_eng
+import Patches_VODCA_eng
+import Timing_VODCA_eng
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+
+def imageanalysis_module():
+    """
+    loads VODCA_Imageanalysis_eng_2.0.py, its file name is no valid module name so it can not be imported directly
+
+    Returns
+    -------
+    module
+        the image analysis module
+
+    """
+    name = 'VODCA_Imageanalysis_eng_2_0'
+    if name not in sys.modules:
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'VODCA_Imageanalysis_eng_2.0.py')
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+    return sys.modules[name]
+
+
+def analyse_folder(folder_directory, folder, contours, prefetch=0, policy='continue', checkpoint_every=50, state=None,
+                   output='csv', store_ratios=False, extract=False, timing=False, grayscale=False, reduce=1,
+                   detect_changes=False, skip_quiescent=False, sensitivity=0.2):
+    """
+    counts the frozen droplets of one subfolder, runs in a worker process,
+    everything the analysis prints is written to log_<folder>.txt in the main folder
+
+    Parameters
+    ----------
+    folder_directory : str
+        path to the main folder
+    folder : str
+        name of the subfolder
+    contours : list
+        x, y coordinates and radius of the detected droplets
+    prefetch : int, optional
+        number of images which are decoded in advance. The default is 0.
+    policy : str, optional
+        continue/skip/abort, answer given instead of asking the user when lots of droplets freeze at once.
+        The default is 'continue'.
+    checkpoint_every : int, optional
+        the state of the analysis is saved after this number of images. The default is 50.
+    state : dict, optional
+        checkpoint the analysis resumes at, if given the contours are taken from it. The default is None.
+    output : str, optional
+        'csv', 'npz' or 'both'. The default is 'csv'.
+    store_ratios : bool, optional
+        save the ratios of all droplets and pairs of frames. The default is False.
+    extract : bool, optional
+        save the pixels of all droplets of all images before they are counted. The default is False.
+    timing : bool, optional
+        measure the stages of the analysis and save them in timing_<folder>.json. The default is False.
+    grayscale : bool, optional
+        decode gray images and detect droplets which get brighter as well. The default is False.
+    reduce : int, optional
+        decode the gray images at 1/reduce of their size. The default is 1.
+    detect_changes : bool, optional
+        correct a moved sample and changed lighting before the droplets are evaluated. The default is False.
+    skip_quiescent : bool, optional
+        evaluate only the droplets which changed according to a coarse score. The default is False.
+    sensitivity : float, optional
+        fraction of the threshold the coarse score is compared with. The default is 0.2.
+
+    Returns
+    -------
+    folder : str
+        name of the subfolder
+    status : str
+        'go on', 'skip' or 'exit' if the analysis finished, 'error' if it failed
+    message : str
+        path to the log file or the error message
+
+    """
+    log_path = os.path.join(folder_directory, f'log_{folder}.txt')
+    with open(log_path, 'w') as log, contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        try:
+            vodca = imageanalysis_module()
+            print(f'currently folder {folder} is being evaluted (worker {os.getpid()})')
+            if timing:
+                Timing_VODCA_eng.start()
+            index = Frames_VODCA_eng.build_frame_index(folder_directory, folder)
+            Frames_VODCA_eng.report_frame_index(index)
+            all_images = index['images']
+
+            if state is not None:
+                print(f'analysis resumes at {state["temperature"]}')
+                contours_YN = state['contours_YN']
+                vodca.prepare_csv(folder_directory, folder, state['rows'].tolist(), output=output)
+            else:
+                contours_YN = np.append(contours, Droplets_VODCA_eng.droplet_mask(contours), axis=1)
+                vodca.prepare_csv(folder_directory, folder, output=output)
+                if extract:
+                    Patches_VODCA_eng.extract_patches(all_images, index['temperatures'], folder_directory, folder,
+                                                      contours, prefetch=prefetch,
+                                                      grayscale=grayscale, reduce=reduce)
+
+            status, contours_YN, ratio, array_radius = vodca.main(
+                all_images, folder, folder_directory, contours_YN, [], [], prefetch=prefetch, policy=policy,
+                checkpoint_every=checkpoint_every, resume=state, output=output, store_ratios=store_ratios,
+                temperatures=index['temperatures'], grayscale=grayscale, reduce=reduce, detect_changes=detect_changes,
+                skip_quiescent=skip_quiescent, sensitivity=sensitivity)
+            if timing:
+                Timing_VODCA_eng.stop(folder_directory, folder)
+            print(f'folder {folder} finished: {status}')
+            return folder, status, log_path
+        except Exception as e:
+            traceback.print_exc()
+            return folder, 'error', f'{type(e).__name__}: {e}'
+
+
+def work_through_folders_parallel(folder_directory, folders, workers, prefetch=0, policy='continue', headless=False,
+                                  redetect=False, checkpoint_every=50, resume=False, output='csv', store_ratios=False,
+                                  extract=False, timing=False, progress=False, grayscale=False, reduce=1,
+                                  detect_changes=False, skip_quiescent=False, sensitivity=0.2):
+    """
+    detects the droplets of all subfolders one after another and then counts the frozen droplets in a process pool.
+
+    On Windows the calling script has to be protected with if __name__ == '__main__'.
+
+    Parameters
+    ----------
+    folder_directory : str
+        path to the main folder
+    folders : list
+        names of the subfolders
+    workers : int
+        number of worker processes
+    prefetch : int, optional
+        number of images which are decoded in advance in every worker. The default is 0.
+    policy : str, optional
+        continue/skip/abort, answer given instead of asking the user when lots of droplets freeze at once.
+        abort cancels the subfolders which did not start yet, the running ones are finished. The default is 'continue'.
+    headless : bool, optional
+        detect the droplets with the saved parameters instead of the interactive window. The default is False.
+    redetect : bool, optional
+        detect the droplets again even if there are saved contours. The default is False.
+    checkpoint_every : int, optional
+        the state of the analysis is saved after this number of images. The default is 50.
+    resume : bool or float, optional
+        resume at the checkpoint (True) or at a temperature, see work_through_folder. The default is False.
+    output : str, optional
+        'csv', 'npz' or 'both'. The default is 'csv'.
+    store_ratios : bool, optional
+        save the ratios of all droplets and pairs of frames. The default is False.
+    extract : bool, optional
+        save the pixels of all droplets of all images before they are counted. The default is False.
+    timing : bool, optional
+        measure the stages of the analysis of every subfolder and save them in timing_<folder>.json.
+        The default is False.
+    progress : bool, optional
+        prints how many subfolders are finished. The default is False.
+    grayscale : bool, optional
+        decode gray images and detect droplets which get brighter as well, needs less memory per worker.
+        The default is False.
+    reduce : int, optional
+        decode the gray images at 1/reduce of their size. The default is 1.
+    detect_changes : bool, optional
+        correct a moved sample and changed lighting before the droplets are evaluated. The default is False.
+    skip_quiescent : bool, optional
+        evaluate only the droplets which changed according to a coarse score. The default is False.
+    sensitivity : float, optional
+        fraction of the threshold the coarse score is compared with. The default is 0.2.
+
+    Returns
+    -------
+    summary : dict
+        status ('go on', 'skip', 'exit', 'error' or 'cancelled') and log file or error message of every subfolder
+
+    """
+    vodca = imageanalysis_module()
+
+    # the contour detection can be interactive, so it is done for all folders before the workers are started
+    contours_of_folders = {}
+    states = {}
+    summary = {}
+    for folder in folders:
+        if resume is not False:
+            states[folder] = Cache_VODCA_eng.load_checkpoint(
+                folder_directory, folder, None if resume is True else resume)
+            if states[folder] is not None:
+                contours_of_folders[folder] = None
+                continue
+
+        # a folder whose droplets can not be detected is reported in the summary, the other folders go on
+        print(f'contour detection of folder {folder}')
+        try:
+            all_images = Frames_VODCA_eng.build_frame_index(folder_directory, folder)['images']
+            if len(all_images) < 2:
+                raise ValueError(f'{len(all_images)} images found, at least 2 are needed')
+            contours = vodca.detect_droplets(all_images[1], folder, folder_directory, headless=headless,
+                                             redetect=redetect)
+        except Exception as e:
+            print(f'contour detection of folder {folder} failed: {e}')
+            summary[folder] = ('error', f'{type(e).__name__}: {e}')
+            continue
+        contours_of_folders[folder] = contours.tolist()
+
+    # only as many folders as there are workers are submitted, so the others can still be cancelled after an abort
+    waiting = list(contours_of_folders.items())
+    aborted = None
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        running = set()
+        while waiting or running:
+            while waiting and len(running) < workers and aborted is None:
+                folder, contours = waiting.pop(0)
+                running.add(executor.submit(analyse_folder, folder_directory, folder, contours, prefetch, policy,
+                                            checkpoint_every, states.get(folder), output, store_ratios, extract,
+                                            timing, grayscale, reduce, detect_changes, skip_quiescent, sensitivity))
+            if aborted is not None:
+                # abort stops the whole evaluation: the folders which did not start yet are cancelled
+                for folder, contours in waiting:
+                    summary[folder] = ('cancelled', f'cancelled after folder {aborted} was aborted')
+                waiting = []
+            if not running:
+                break
+
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                folder, status, message = future.result()
+                summary[folder] = (status, message)
+                print(f'folder {folder} finished: {status}')
+                if progress:
+                    print(f'{len(summary)}/{len(folders)} folders finished')
+                if status == 'exit' and aborted is None:
+                    aborted = folder
+
+    print('-------------------------------------------------')
+    succeeded = [folder for folder, (status, message) in summary.items() if status not in ('error', 'cancelled')]
+    failed = [folder for folder, (status, message) in summary.items() if status == 'error']
+    cancelled = [folder for folder, (status, message) in summary.items() if status == 'cancelled']
+    print(f'{len(succeeded)} folders evaluated, {len(failed)} failed, {len(cancelled)} cancelled')
+    for folder in failed:
+        print(f'{folder}: {summary[folder][1]}')
+    print('-------------------------------------------------')
+    return summary
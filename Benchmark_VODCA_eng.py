@@ -0,0 +1,279 @@
+import os
+import time
+import tempfile
+import functools
+import tracemalloc
+import numpy as np
+import Batch_VODCA_eng
+import Frames_VODCA_eng
+import Droplets_VODCA_eng
+import Results_VODCA_eng
+import Slider_VODCA_eng
+import Auswertung_VODCA_eng
+import Synthetic_VODCA_eng
+
+
+# number of droplets and number of images of the benchmarked series
+SCALES = ((20, 30), (60, 60), (120, 120))
+
+# contrast of the freezing droplets and noise of the low-contrast checks, see grayscale_calibration
+CALIBRATION_CASES = ((2, 3), (2, 6))
+
+# the rendered droplets have clean edges without texture, they get less votes in HoughCircles than real droplets
+BENCHMARK_PARAMETERS = dict(Slider_VODCA_eng.DEFAULT_PARAMETERS, param2=15)
+
+
+def measure(function, *args, **kwargs):
+    """
+    runs a function and measures its run time and the peak of the memory allocated by python and numpy
+
+    Returns
+    -------
+    result
+        return value of the function
+    seconds : float
+        run time
+    peak_mb : float
+        peak of the allocated memory in MB, memory allocated inside of OpenCV is not traced
+
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = function(*args, **kwargs)
+    finally:
+        seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, seconds, peak / 1e6
+
+
+def detection_accuracy(detected, truth, tolerance=10):
+    """
+    compares the detected droplets with the rendered ones
+
+    Parameters
+    ----------
+    detected : numpy array or None
+        x, y coordinates and radius of the detected droplets
+    truth : numpy array
+        x, y coordinates and radius of the rendered droplets
+    tolerance : float, optional
+        maximum distance of the centres in pt. The default is 10.
+
+    Returns
+    -------
+    recall : float
+        fraction of the rendered droplets which were detected
+    precision : float
+        fraction of the detected droplets which exist
+
+    """
+    if detected is None or len(detected) == 0:
+        return 0.0, 0.0
+    detected = np.asarray(detected, dtype=float)[:, :2]
+    truth = np.asarray(truth, dtype=float)[:, :2]
+    distances = np.linalg.norm(detected[:, np.newaxis] - truth[np.newaxis], axis=2)
+    matched = distances <= tolerance
+    return matched.any(axis=0).mean(), matched.any(axis=1).mean()
+
+
+def freeze_accuracy(freeze_temperatures, truth):
+    """
+    compares the freezing temperatures of the analysis with the rendered ones
+
+    Returns
+    -------
+    accuracy : float
+        fraction of the evaluated droplets with the correct freezing temperature (or correctly not frozen)
+    false_frozen : int
+        number of evaluated droplets which were detected as frozen too early or without freezing
+
+    """
+    evaluated = truth['evaluated']
+    found = np.asarray(freeze_temperatures, dtype=float)[evaluated]
+    expected = truth['freeze_temperatures'][evaluated]
+    correct = (found == expected) | (np.isnan(found) & np.isnan(expected))
+    with np.errstate(invalid='ignore'):
+        false_frozen = ~np.isnan(found) & (np.isnan(expected) | (found < expected))
+    return float(correct.mean()), int(np.count_nonzero(false_frozen))
+
+
+def benchmark_series(folder_directory, n_droplets, n_frames, seed=0, parameters=None, **kwargs):
+    """
+    renders one synthetic series and measures the contour detection, the counting of the frozen droplets
+    and the data evaluation
+
+    Parameters
+    ----------
+    folder_directory : str
+        main folder, the series is written to the subfolder synthetic
+    n_droplets : int
+        number of droplets
+    n_frames : int
+        number of images
+    seed : int, optional
+        seed of the synthetic series. The default is 0.
+    parameters : dict, optional
+        parameters of the contour detection, None uses BENCHMARK_PARAMETERS. The default is None.
+    **kwargs : TYPE
+        optional arguments of Synthetic_VODCA_eng.synthetic_series (noise, drift, ...)
+
+    Returns
+    -------
+    report : dict
+        run times (s), frames/s, peak memory (MB) and accuracies
+
+    """
+    vodca = Batch_VODCA_eng.imageanalysis_module()
+
+    filename = 'synthetic'
+    truth = Synthetic_VODCA_eng.synthetic_series(os.path.join(folder_directory, filename), n_droplets, n_frames,
+                                                 seed=seed, **kwargs)
+    report = {'droplets': n_droplets, 'frames': n_frames}
+
+    # contour detection
+    contours, report['detection_s'], report['detection_mb'] = measure(
+        Slider_VODCA_eng.recognize_contour, truth['images'][1], **(parameters or BENCHMARK_PARAMETERS))
+    contours = contours[1]
+    report['detection_recall'], report['detection_precision'] = detection_accuracy(
+        None if contours is None else contours[0], truth['contours'])
+
+    # decoding of the images alone
+    frames = Frames_VODCA_eng.FrameSource(truth['images'])
+    _, report['decode_s'], report['decode_mb'] = measure(lambda: [frames.get(i).shape for i in range(len(frames))])
+    frames.close()
+
+    # counting of the frozen droplets with the rendered contours, so the accuracy does not depend on the detection
+    contours_YN = np.append(truth['contours'], Droplets_VODCA_eng.droplet_mask(truth['contours']), axis=1)
+    vodca.prepare_csv(folder_directory, filename, output='npz')
+    _, report['count_s'], report['count_mb'] = measure(
+        vodca.main, truth['images'], filename, folder_directory, contours_YN, [], [], policy='continue',
+        checkpoint_every=0, output='npz', temperatures=truth['temperatures'])
+    report['frames_per_s'] = (n_frames - 1) / report['count_s']
+
+    with np.load(Results_VODCA_eng.npz_path(folder_directory, filename)) as results:
+        freeze_temperatures = results['freeze_temperature']
+    report['freeze_accuracy'], report['false_frozen'] = freeze_accuracy(freeze_temperatures, truth)
+
+    _, report['evaluation_s'], report['evaluation_mb'] = measure(
+        Auswertung_VODCA_eng.data_evaluation, folder_directory)
+    return report
+
+
+def grayscale_calibration(folder_directory, contrast=2, noise=3, n_droplets=20, n_frames=8, seed=0, reduce=1,
+                          threshold=50):
+    """
+    low-contrast check of the grayscale mode: the droplets of a synthetic series darken by only a few gray values
+    when they freeze, they have to get about the same ratio in the BGR and in the grayscale mode and the noise
+    of the liquid droplets has to stay below the threshold in both modes, also for noisy images
+
+    Parameters
+    ----------
+    folder_directory : str
+        main folder, the series is written to the subfolder calibration
+    contrast : int, optional
+        the droplets get darker by this gray value when they freeze. The default is 2.
+    noise : float, optional
+        amplitude of the noise added to every pixel in gray values. The default is 3.
+    n_droplets : int, optional
+        number of droplets. The default is 20.
+    n_frames : int, optional
+        number of images. The default is 8.
+    seed : int, optional
+        seed of the synthetic series. The default is 0.
+    reduce : int, optional
+        the gray images are decoded at 1/reduce of their size. The default is 1.
+    threshold : float, optional
+        droplets with a higher sum of differences/ Area are detected as frozen. The default is 50.
+
+    Returns
+    -------
+    report : dict
+        for 'bgr' and 'gray' the mean ratio of the droplets on the image they freeze, the highest ratio of
+        the liquid droplets, the fraction of the freezing droplets which exceed the threshold and the fraction
+        of the liquid droplets which exceed it
+
+    """
+    truth = Synthetic_VODCA_eng.synthetic_series(os.path.join(folder_directory, 'calibration'), n_droplets, n_frames,
+                                                 noise=noise, frozen_fraction=1.0, contrast=contrast, seed=seed)
+    decoders = {'bgr': (Frames_VODCA_eng.load_image, 1),
+                'gray': (functools.partial(Frames_VODCA_eng.load_gray, reduce=reduce), reduce)}
+
+    report = {}
+    for mode, (decoder, scale) in decoders.items():
+        frames = Frames_VODCA_eng.FrameSource(truth['images'], decoder=decoder)
+        label_map = Droplets_VODCA_eng.DropletLabelMap(truth['contours'], frames.get(0).shape,
+                                                       absolute=mode == 'gray', reduce=scale)
+        freezing, liquid = [], []
+        for i in range(n_frames - 1):
+            ratios = label_map.ratios(frames.get(i), frames.get(i + 1))[truth['evaluated']]
+            freezes = truth['freeze_temperatures'][truth['evaluated']] == truth['temperatures'][i + 1]
+            freezing.append(ratios[freezes])
+            liquid.append(ratios[~freezes])
+        frames.close()
+        freezing, liquid = np.concatenate(freezing), np.concatenate(liquid)
+        report[mode] = {'freezing_ratio': float(freezing.mean()), 'noise_ratio': float(liquid.max()),
+                        'detected': float(np.mean(freezing > threshold)),
+                        'false_frozen': float(np.mean(liquid > threshold))}
+    return report
+
+
+def run_benchmark(scales=SCALES, directory=None, seed=0, parameters=None, **kwargs):
+    """
+    benchmarks the pipeline with synthetic series of several sizes and prints a table
+
+    Parameters
+    ----------
+    scales : tuple, optional
+        pairs of number of droplets and number of images. The default is SCALES.
+    directory : str, optional
+        folder the series are written to, None uses a temporary folder which is deleted afterwards.
+        The default is None.
+    seed : int, optional
+        seed of the synthetic series. The default is 0.
+    parameters : dict, optional
+        parameters of the contour detection, None uses BENCHMARK_PARAMETERS. The default is None.
+    **kwargs : TYPE
+        optional arguments of Synthetic_VODCA_eng.synthetic_series (noise, drift, ...)
+
+    Returns
+    -------
+    reports : list
+        one report per scale, see benchmark_series
+
+    """
+    reports = []
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        for n_droplets, n_frames in scales:
+            folder_directory = os.path.join(directory or temporary_directory, f'benchmark_{n_droplets}_{n_frames}')
+            os.makedirs(folder_directory, exist_ok=True)
+            report = benchmark_series(folder_directory, n_droplets, n_frames, seed=seed, parameters=parameters,
+                                      **kwargs)
+            reports.append(report)
+
+            print('-------------------------------------------------')
+            print(f"{n_droplets} droplets, {n_frames} images")
+            print(f"detection:  {report['detection_s']:.2f} s, {report['detection_mb']:.0f} MB, "
+                  f"recall {report['detection_recall']:.3f}, precision {report['detection_precision']:.3f}")
+            print(f"decoding:   {report['decode_s']:.2f} s, {report['decode_mb']:.0f} MB")
+            print(f"counting:   {report['count_s']:.2f} s ({report['frames_per_s']:.1f} frames/s), "
+                  f"{report['count_mb']:.0f} MB, freezing accuracy {report['freeze_accuracy']:.3f}, "
+                  f"{report['false_frozen']} droplets frozen too early")
+            print(f"evaluation: {report['evaluation_s']:.2f} s, {report['evaluation_mb']:.0f} MB")
+
+        for contrast, noise in CALIBRATION_CASES:
+            calibration = grayscale_calibration(directory or temporary_directory, contrast=contrast, noise=noise,
+                                                seed=seed)
+            print('-------------------------------------------------')
+            print(f'low-contrast check, the droplets darken by {contrast} gray values, noise {noise}')
+            for mode, report in calibration.items():
+                print(f"{mode}: ratio {report['freezing_ratio']:.1f}, noise up to {report['noise_ratio']:.1f}, "
+                      f"{report['detected']:.3f} of the freezing droplets detected, "
+                      f"{report['false_frozen']:.3f} of the liquid droplets detected")
+    print('-------------------------------------------------')
+    return reports
+
+
+if __name__ == '__main__':
+    run_benchmark()
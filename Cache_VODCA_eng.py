@@ -0,0 +1,190 @@
+import os
+import json
+import hashlib
+import numpy as np
+import Droplets_VODCA_eng
+import Results_VODCA_eng
+
+
+def image_hash(image_path):
+    """
+    sha1 hash of the content of an image, renaming the image does not change it
+
+    Parameters
+    ----------
+    image_path : str
+        path to the image
+
+    Returns
+    -------
+    str
+        hex digest of the image file
+
+    """
+    sha1 = hashlib.sha1()
+    with open(image_path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def contour_cache_path(folder_directory, filename):
+    return os.path.join(folder_directory, f'contours_{filename}.npz')
+
+
+def save_contours(folder_directory, filename, image_path, contours, parameters):
+    """
+    saves the accepted contours next to the csv file
+
+    Parameters
+    ----------
+    folder_directory : str
+        path to the main folder
+    filename : str
+        name of the subfolder
+    image_path : str
+        path to the image the contours were detected in
+    contours : numpy array
+        x, y coordinates and radius of the droplets
+    parameters : dict
+        parameters of the contour detection
+
+    Returns
+    -------
+    None.
+
+    """
+    np.savez(contour_cache_path(folder_directory, filename),
+             contours=np.asarray(contours),
+             image_hash=image_hash(image_path),
+             parameters=json.dumps(parameters, sort_keys=True))
+
+
+def load_contours(folder_directory, filename, image_path, parameters=None):
+    """
+    loads the saved contours if they were detected in the same image (and with the same parameters)
+
+    Parameters
+    ----------
+    folder_directory : str
+        path to the main folder
+    filename : str
+        name of the subfolder
+    image_path : str
+        path to the image the contours should be detected in
+    parameters : dict, optional
+        parameters of the contour detection, None accepts contours detected with any parameters. The default is None.
+
+    Returns
+    -------
+    contours : numpy array or None
+        x, y coordinates and radius of the droplets, None if there are no matching saved contours
+
+    """
+    path = contour_cache_path(folder_directory, filename)
+    if not os.path.exists(path):
+        return None
+
+    with np.load(path) as saved:
+        if str(saved['image_hash']) != image_hash(image_path):
+            return None
+        if parameters is not None and str(saved['parameters']) != json.dumps(parameters, sort_keys=True):
+            return None
+        return saved['contours']
+
+
+def checkpoint_path(folder_directory, filename):
+    return os.path.join(folder_directory, f'checkpoint_{filename}.npz')
+
+
+def save_checkpoint(folder_directory, filename, contours_YN, freeze_temperatures, temperature, rows, freeze_steps=None):
+    """
+    saves the state of the analysis of a subfolder
+
+    Parameters
+    ----------
+    folder_directory : str
+        path to the main folder
+    filename : str
+        name of the subfolder
+    contours_YN : numpy array
+        x, y coordinates, radius and mask (1 for liquid droplets) of the droplets
+    freeze_temperatures : numpy array
+        freezing temperature of every droplet, nan for liquid droplets
+    temperature : float
+        temperature of the last evaluated image
+    rows : list
+        rows of the csv file up to this temperature
+    freeze_steps : numpy array, optional
+        row every droplet was written to, -1 for liquid droplets. The default is None, the rows are found
+        by the freezing temperatures when the checkpoint is loaded.
+
+    Returns
+    -------
+    None.
+
+    """
+    path = checkpoint_path(folder_directory, filename)
+
+    # the checkpoint is written to a temporary file first, so a crash while saving does not destroy the old one
+    temporary_path = path + '.tmp.npz'
+    steps = {} if freeze_steps is None else {'freeze_steps': np.asarray(freeze_steps, dtype=np.int32)}
+    np.savez(temporary_path,
+             contours_YN=np.asarray(contours_YN, dtype=float),
+             freeze_temperatures=np.asarray(freeze_temperatures, dtype=float),
+             temperature=float(temperature),
+             rows=np.array(rows, dtype=str).reshape(-1, 3),
+             **steps)
+    os.replace(temporary_path, path)
+
+
+def load_checkpoint(folder_directory, filename, temperature=None):
+    """
+    loads the state of the analysis of a subfolder at the temperature of the checkpoint or at an earlier temperature
+
+    Parameters
+    ----------
+    folder_directory : str
+        path to the main folder
+    filename : str
+        name of the subfolder
+    temperature : float, optional
+        temperature the analysis resumes at, droplets which froze later are liquid again.
+        None resumes at the temperature of the checkpoint. The default is None.
+
+    Returns
+    -------
+    state : dict or None
+        contours_YN, freeze_temperatures, freeze_steps, temperature and rows, None if there is no checkpoint
+
+    """
+    path = checkpoint_path(folder_directory, filename)
+    if not os.path.exists(path):
+        return None
+
+    with np.load(path) as saved:
+        state = {key: saved[key] for key in saved.files}
+
+    checkpoint_temperature = float(state['temperature'])
+    if temperature is None or temperature > checkpoint_temperature:
+        temperature = checkpoint_temperature
+
+    # droplets which froze after the temperature are liquid again, excluded droplets stay switched off
+    freeze_temperatures = state['freeze_temperatures']
+    with np.errstate(invalid='ignore'):
+        freeze_temperatures[freeze_temperatures > temperature] = np.nan
+    contours_YN = state['contours_YN']
+    contours_YN[:, 3] = np.isnan(freeze_temperatures) & ~Droplets_VODCA_eng.excluded_droplets(contours_YN)
+
+    rows = state['rows']
+    rows = rows[rows[:, 0].astype(float) <= temperature]
+
+    # without the rows of the droplets (older checkpoints) they are found by the freezing temperatures
+    if 'freeze_steps' in state:
+        freeze_steps = state['freeze_steps']
+        freeze_steps[np.isnan(freeze_temperatures)] = -1
+    else:
+        freeze_steps = Results_VODCA_eng.freeze_steps_of(freeze_temperatures, rows[:, 0].astype(float))
+
+    return {'contours_YN': contours_YN, 'freeze_temperatures': freeze_temperatures, 'freeze_steps': freeze_steps,
+            'temperature': float(temperature), 'rows': rows}
@@ -0,0 +1,284 @@
+import os
+import csv
+import numpy as np
+import cv2 as cv
+import Droplets_VODCA_eng
+
+
+def events_path(folder_directory, filename):
+    return os.path.join(folder_directory, f'events_{filename}.csv')
+
+
+def write_event(folder_directory, filename, temperature, event, change, scale=1):
+    """
+    appends an event (sample moved, lighting changed) to events_<name>.csv
+
+    Parameters
+    ----------
+    folder_directory : str
+        path to the main folder
+    filename : str
+        name of the subfolder
+    temperature : float
+        temperature of the second image of the pair
+    event : str
+        'moved', 'lighting' or 'many frozen'
+    change : dict
+        result of ChangeDetector.check
+    scale : int, optional
+        the frames are smaller than the images the contours were detected in by this factor, the shift is
+        written in pixels of these images. The default is 1.
+
+    Returns
+    -------
+    None.
+
+    """
+    path = events_path(folder_directory, filename)
+    new_file = not os.path.exists(path)
+    with open(path, mode='a', newline='') as file:
+        writer = csv.writer(file)
+        if new_file:
+            writer.writerow(['temperature', 'event', 'dx', 'dy', 'brightness'])
+        writer.writerow([temperature, event, round(change['shift'][0] * scale, 2),
+                         round(change['shift'][1] * scale, 2), round(change['brightness'], 2)])
+
+
+class ChangeDetector:
+    """
+    compares downsampled gray versions of two frames before the droplets are evaluated:
+    the shift of the sample is estimated with phase correlation and the change of the lighting with
+    the median difference, which is hardly affected by the droplets which freeze.
+    The shift of a moved sample is refined with phase correlation of the frames at full size,
+    the downsampled frames are only accurate to about one of their pixels
+    """
+
+    def __init__(self, shift_limit=2.0, brightness_limit=8.0, downsample=8):
+        """
+        Parameters
+        ----------
+        shift_limit : float, optional
+            shifts larger than this number of pixels are reported as a moved sample. The default is 2.0.
+        brightness_limit : float, optional
+            changes of the brightness larger than this number of gray values are reported as changed lighting.
+            The default is 8.0.
+        downsample : int, optional
+            the frames are compared at 1/downsample of their size. The default is 8.
+
+        """
+        self.shift_limit = shift_limit
+        self.brightness_limit = brightness_limit
+        self.downsample = downsample
+        self.last = None
+
+    def small(self, i, image):
+        """
+        downsampled gray version of frame i, the last one is kept so every frame is only downsampled once
+        """
+        if self.last is not None and self.last[0] == i:
+            return self.last[1]
+        if image.ndim == 3:
+            image = cv.cvtColor(image, cv.COLOR_BGR2GRAY)
+        height, width = image.shape
+        small = cv.resize(image, (width // self.downsample, height // self.downsample), interpolation=cv.INTER_AREA)
+        small = small.astype(np.float32)
+        self.last = (i, small)
+        return small
+
+    def check(self, i, image1, image2):
+        """
+        compares the frames i and i+1
+
+        Parameters
+        ----------
+        i : int
+            index of the first frame
+        image1 : numpy array
+            first frame
+        image2 : numpy array
+            second frame
+
+        Returns
+        -------
+        change : dict
+            shift (dx, dy) of the second frame in pixels, brightness (median difference of the second and
+            the first frame in gray values), moved and lighting (True if the limits are exceeded)
+
+        """
+        small1 = self.small(i, image1)
+        small2 = self.small(i + 1, image2)
+        (dx, dy), response = cv.phaseCorrelate(small1, small2)
+        shift = (dx * self.downsample, dy * self.downsample)
+        brightness = float(np.median(small2 - small1))
+        moved = bool(np.hypot(*shift) > self.shift_limit)
+        if moved:
+            shift, response = self.refine(image1, image2, shift)
+        return {'shift': shift, 'response': response, 'brightness': brightness,
+                'moved': moved, 'lighting': bool(abs(brightness) > self.brightness_limit)}
+
+    def refine(self, image1, image2, shift):
+        """
+        refines the shift of the downsampled frames at full size: the first frame is moved by the coarse shift
+        and the remaining shift is estimated with phase correlation of the full frames
+
+        Parameters
+        ----------
+        image1 : numpy array
+            first frame
+        image2 : numpy array
+            second frame
+        shift : tuple
+            coarse shift (dx, dy) in pixels
+
+        Returns
+        -------
+        shift : tuple
+            refined shift (dx, dy) in pixels
+        response : float
+            peak of the phase correlation
+
+        """
+        gray1, gray2 = (cv.cvtColor(image, cv.COLOR_BGR2GRAY) if image.ndim == 3 else image
+                        for image in (image1, image2))
+        height, width = gray1.shape
+        matrix = np.float32([[1, 0, shift[0]], [0, 1, shift[1]]])
+        moved1 = cv.warpAffine(gray1, matrix, (width, height), borderMode=cv.BORDER_REPLICATE)
+
+        # the window suppresses the edges of the frames, which do not move with the sample
+        window = cv.createHanningWindow((width, height), cv.CV_32F)
+        (dx, dy), response = cv.phaseCorrelate(moved1.astype(np.float32), gray2.astype(np.float32), window)
+        return (shift[0] + dx, shift[1] + dy), response
+
+
+def register(image1, change):
+    """
+    moves and brightens the first frame, so it matches the second frame
+
+    Parameters
+    ----------
+    image1 : numpy array
+        first frame
+    change : dict
+        result of ChangeDetector.check
+
+    Returns
+    -------
+    image1 : numpy array
+        the registered first frame
+
+    """
+    if change['moved']:
+        dx, dy = change['shift']
+        height, width = image1.shape[:2]
+        matrix = np.float32([[1, 0, dx], [0, 1, dy]])
+        image1 = cv.warpAffine(image1, matrix, (width, height), borderMode=cv.BORDER_REPLICATE)
+
+    # the brightness is always adjusted, so a slow drift of the lighting does not add up to the differences
+    offset = int(round(change['brightness']))
+    if offset:
+        image1 = cv.add(image1, (offset, offset, offset, 0))
+    return image1
+
+
+class QuiescenceFilter:
+    """
+    finds the droplets which changed between two frames with a coarse score on downsampled gray frames,
+    so the full evaluation only has to read the pixels of these droplets and pairs of frames without any
+    changed droplet are skipped.
+
+    The downsampling averages blocks of pixels: the mean difference of a droplet which darkens as a whole is
+    kept while most of the noise is removed. The score is the larger of the darkening and the brightening of the
+    droplet in the small frames, scaled like the ratios of the full evaluation, so it is compared with a fraction
+    (sensitivity) of the threshold the droplets are detected as frozen with.
+
+    This assumes that a freezing droplet changes its mean brightness. Changes which do not, e.g. a pattern
+    which moves inside of the droplet, shrink in the small frames and the droplet can be skipped, so the skipping
+    can change the results and is not only faster.
+    """
+
+    def __init__(self, contours, shape, sensitivity=0.2, threshold=50, downsample=8, reduce=1):
+        """
+        Parameters
+        ----------
+        contours : numpy array
+            contains x, y coordinates and radius of the droplets
+        shape : tuple
+            height and width of the frames
+        sensitivity : float, optional
+            droplets are evaluated if their score exceeds sensitivity * threshold, smaller values skip less.
+            The default is 0.2.
+        threshold : float, optional
+            threshold of the sum of differences/ Area the droplets are detected as frozen with. The default is 50.
+        downsample : int, optional
+            the frames are compared at 1/downsample of their size. The default is 8.
+        reduce : int, optional
+            the frames are smaller than the images the contours were detected in by this factor. The default is 1.
+
+        """
+        self.limit = sensitivity * threshold
+        self.downsample = downsample
+        self.small_shape = (shape[0] // downsample, shape[1] // downsample)
+        self.label_map = Droplets_VODCA_eng.DropletLabelMap(contours, self.small_shape, absolute=True,
+                                                            reduce=reduce * downsample)
+        # the score is no upper bound of the ratio of the full evaluation: the blocks are averaged before the
+        # difference is taken, so |mean(d)| <= mean(|d|) and changes which are not uniform shrink. Only the margin
+        # of the sensitivity protects a freezing droplet whose mean brightness changes less than its pixels
+        self.scale = 3 * 3.14 * np.pi
+        self.last = None
+        self.pairs = 0
+        self.pairs_skipped = 0
+        self.droplets_skipped = 0
+
+    def small(self, i, image):
+        """
+        downsampled gray version of frame i, the last one is kept so every frame is only downsampled once
+        """
+        if i is not None and self.last is not None and self.last[0] == i:
+            return self.last[1]
+        if image.ndim == 3:
+            image = cv.cvtColor(image, cv.COLOR_BGR2GRAY)
+        small = cv.resize(image, self.small_shape[::-1], interpolation=cv.INTER_AREA)
+        self.last = (i, small)
+        return small
+
+    def changed(self, i, image1, image2, active, registered=False):
+        """
+        finds the droplets which have to be evaluated for the frames i and i+1
+
+        Parameters
+        ----------
+        i : int
+            index of the first frame
+        image1 : numpy array
+            first frame
+        image2 : numpy array
+            second frame
+        active : numpy array
+            boolean mask of the droplets which are still evaluated
+        registered : bool, optional
+            the first frame was moved or brightened, so its saved small version can not be used.
+            The default is False.
+
+        Returns
+        -------
+        droplets : numpy array
+            boolean mask of the active droplets which changed, droplets without pixels in the small frames
+            are always evaluated
+
+        """
+        small1 = self.small(None if registered else i, image1)
+        small2 = self.small(i + 1, image2)
+        sums = self.label_map.difference_sums(small1, small2)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scores = np.where(self.label_map.area > 0, sums * self.scale / self.label_map.area, np.inf)
+        droplets = np.asarray(active, dtype=bool) & (scores > self.limit)
+
+        self.pairs += 1
+        self.droplets_skipped += int(np.count_nonzero(active)) - int(np.count_nonzero(droplets))
+        if not droplets.any():
+            self.pairs_skipped += 1
+        return droplets
+
+    def report(self):
+        return f'{self.pairs_skipped} of {self.pairs} pairs of frames without changed droplets were skipped, ' \
+               f'{self.droplets_skipped} evaluations of droplets were skipped'
@@ -0,0 +1,439 @@
+import os
+import numpy as np
+import cv2 as cv
+
+
+def excluded_droplets(contours):
+    """
+    finds the droplets which are not evaluated: too small droplets and droplets in the labelling of the picture in the right corner
+
+    Parameters
+    ----------
+    contours : numpy array
+        contains x, y coordinates and radius of the droplets
+
+    Returns
+    -------
+    excluded : numpy array
+        boolean mask, True for droplets which are not evaluated
+
+    """
+    contours = np.asarray(contours)
+    x, y, r = contours[:, 0], contours[:, 1], contours[:, 2]
+    return (r < 48) | ((x + r > 1648) & (y + r > 1445))
+
+
+def droplet_mask(contours):
+    """
+    mask column of the detected droplets, the exclusion rules are applied once here and not for every image
+
+    Parameters
+    ----------
+    contours : numpy array or list
+        contains x, y coordinates and radius of the droplets
+
+    Returns
+    -------
+    mask : numpy array
+        1 for droplets which are evaluated, 0 for excluded droplets, one row per droplet
+
+    """
+    return (~excluded_droplets(contours)).astype(int)[:, np.newaxis]
+
+
+class DropletLabelMap:
+    """
+    label image of the droplets, built once from the detected contours,
+    so the differences of all droplets of a pair of frames can be summed up in one pass.
+    Droplets which froze can be removed with compact, so only the pixels of the liquid droplets are read
+    """
+
+    def __init__(self, contours, shape, absolute=False, reduce=1):
+        """
+        Parameters
+        ----------
+        contours : numpy array
+            contains x, y coordinates and radius of the droplets
+        shape : tuple
+            height and width of the images
+        absolute : bool, optional
+            droplets which get brighter count as well: the larger of the sums of the differences saturated
+            at 0 in both directions is taken, instead of only the darkening. The default is False.
+        reduce : int, optional
+            the images are smaller than the images the contours were detected in by this factor. The default is 1.
+
+        """
+        contours = np.asarray(contours, dtype=float)[:, :3] / reduce
+        contours = np.around(contours).astype(int)
+        self.n_droplets = len(contours)
+        self.shape = tuple(shape[:2])
+        self.absolute = absolute
+
+        # the gathered pixels and their differences are written into buffers which are reused for every pair of frames
+        self.buffers = {}
+
+        # every droplet gets a circular mask with its own label, 0 is the background
+        labels = np.zeros(self.shape, dtype=np.int32)
+        for i, (x, y, r) in enumerate(contours[:, :3]):
+            cv.circle(labels, (int(x), int(y)), int(r), i + 1, -1)
+
+        # only the pixels inside of droplets are needed later on, they are sorted by droplet
+        # so the pixels of every droplet lie next to each other and can be summed up with np.add.reduceat
+        pixels = np.flatnonzero(labels)
+        pixel_labels = labels.ravel()[pixels] - 1
+        order = np.argsort(pixel_labels, kind='stable')
+        self.pixels = pixels[order]
+        self.pixel_labels = pixel_labels[order]
+        self.area = np.bincount(pixel_labels, minlength=self.n_droplets)
+        self.active = np.ones(self.n_droplets, dtype=bool)
+
+        # droplets without any pixel (outside of the image or covered by other droplets) get a sum of 0
+        self.nonempty = self.area > 0
+        self.offsets = np.cumsum(self.area) - self.area
+        self.starts = self.offsets[self.nonempty]
+
+    def compact(self, active):
+        """
+        removes the pixels of the droplets which are not active any more (frozen or excluded droplets),
+        their sums are 0 from now on
+
+        Parameters
+        ----------
+        active : numpy array
+            boolean mask of the droplets which are still evaluated
+
+        Returns
+        -------
+        None.
+
+        """
+        active = np.asarray(active, dtype=bool) & self.active
+        if np.array_equal(active, self.active):
+            return
+
+        keep = active[self.pixel_labels]
+        self.pixels = self.pixels[keep]
+        self.pixel_labels = self.pixel_labels[keep]
+        self.active = active
+
+        active_area = np.where(active, self.area, 0)
+        self.nonempty = active_area > 0
+        self.offsets = np.cumsum(active_area) - active_area
+        self.starts = self.offsets[self.nonempty]
+
+    def select(self, droplets):
+        """
+        finds the gathered pixels of some of the droplets
+
+        Parameters
+        ----------
+        droplets : numpy array
+            boolean mask of the droplets
+
+        Returns
+        -------
+        pixels : numpy array
+            indices of the pixels of the droplets in the image, sorted by droplet
+        nonempty : numpy array
+            boolean mask of the droplets with pixels
+        starts : numpy array
+            first pixel of every droplet with pixels in pixels
+
+        """
+        area = np.where(np.asarray(droplets, dtype=bool) & self.active, self.area, 0)
+        nonempty = area > 0
+        lengths = area[nonempty]
+        starts = np.cumsum(lengths) - lengths
+        positions = np.repeat(self.offsets[nonempty] - starts, lengths) + np.arange(lengths.sum())
+        return self.pixels[positions], nonempty, starts
+
+    def buffer(self, name, shape, dtype):
+        """
+        returns the buffer name, a new one is only allocated if the shape changed
+        """
+        buffer = self.buffers.get(name)
+        if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+            buffer = self.buffers[name] = np.empty(shape, dtype=dtype)
+        return buffer
+
+    def gather(self, image, out=None):
+        """
+        cuts out the pixels of all droplets of an image
+
+        Parameters
+        ----------
+        image : numpy array
+            gray or BGR image
+        out : numpy array, optional
+            array the pixels are written to. The default is None.
+
+        Returns
+        -------
+        pixels : numpy array
+            pixels x channels, the pixels of every droplet lie next to each other in the order of the droplets
+
+        """
+        channels = image.shape[2] if image.ndim == 3 else 1
+        return np.take(image.reshape(-1, channels), self.pixels, axis=0, out=out)
+
+    def gathered_difference_sums(self, pixels1, pixels2, nonempty=None, starts=None):
+        """
+        sums up the differences pixels1 - pixels2 of the gathered pixels of every droplet
+
+        Parameters
+        ----------
+        pixels1 : numpy array
+            pixels of the first image, see gather
+        pixels2 : numpy array
+            pixels of the second image
+        nonempty, starts : numpy array, optional
+            droplets and their first pixels if only some droplets were gathered, see select.
+            The default is None, all active droplets.
+
+        Returns
+        -------
+        sums : numpy array
+            sum of differences for every droplet
+
+        """
+        if nonempty is None:
+            nonempty, starts = self.nonempty, self.starts
+        sums = np.zeros(self.n_droplets, dtype=np.int64)
+        if len(pixels1) == 0:
+            return sums
+
+        # cv.subtract saturates at 0 like the subtraction of the cropped droplets did
+        channels = pixels1.shape[1]
+        differences = self.buffer('differences', pixels1.shape, pixels1.dtype)
+        if not self.absolute:
+            cv.subtract(np.asarray(pixels1), np.asarray(pixels2), dst=differences)
+            sums[nonempty] = np.add.reduceat(differences.ravel(), starts * channels, dtype=np.int64)
+            return sums
+
+        # the larger of the saturated sums of darkening and brightening is (sum of |d| + |sum of d|)/ 2,
+        # so the noise counts only once like in the saturated difference and is not doubled by the absolute value
+        cv.absdiff(np.asarray(pixels1), np.asarray(pixels2), dst=differences)
+        absolute_sums = np.add.reduceat(differences.ravel(), starts * channels, dtype=np.int64)
+        change = (np.add.reduceat(np.asarray(pixels1).ravel(), starts * channels, dtype=np.int64)
+                  - np.add.reduceat(np.asarray(pixels2).ravel(), starts * channels, dtype=np.int64))
+        sums[nonempty] = (absolute_sums + np.abs(change)) // 2
+        return sums
+
+    def difference_sums(self, image1, image2, droplets=None):
+        """
+        sums up the differences image1 - image2 inside of every droplet
+
+        Parameters
+        ----------
+        image1 : numpy array
+            first image
+        image2 : numpy array
+            second image
+        droplets : numpy array, optional
+            boolean mask of the droplets which are evaluated, the others get a sum of 0.
+            The default is None, all active droplets.
+
+        Returns
+        -------
+        sums : numpy array
+            sum of differences for every droplet
+
+        """
+        channels = image1.shape[2] if image1.ndim == 3 else 1
+        if droplets is not None:
+            pixels, nonempty, starts = self.select(droplets)
+            pixels1 = np.take(image1.reshape(-1, channels), pixels, axis=0)
+            pixels2 = np.take(image2.reshape(-1, channels), pixels, axis=0)
+            return self.gathered_difference_sums(pixels1, pixels2, nonempty, starts)
+
+        pixels1 = self.gather(image1, self.buffer('pixels1', (len(self.pixels), channels), image1.dtype))
+        pixels2 = self.gather(image2, self.buffer('pixels2', (len(self.pixels), channels), image2.dtype))
+        return self.gathered_difference_sums(pixels1, pixels2)
+
+    def sums_to_ratios(self, sums, channels=3):
+        # the sums of gray images are scaled to the sums of the three channels of BGR images,
+        # so a droplet which darkens by the same gray value gets the same ratio in both modes
+        scale = 3 / channels
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(self.area > 0, sums * scale * 3.14 * np.pi / self.area, 0)
+
+    def ratios(self, image1, image2, droplets=None):
+        """
+        calculates the sum of differences/ Area for every droplet
+
+        the area of a droplet is about pi*r**2, so the sum is scaled with 3.14*pi/ Area, which is the
+        sum*3.14/r**2 of the square crops, and a frozen droplet still exceeds the same threshold.
+        The sums of gray images are multiplied by 3, so a droplet which darkens by the same gray value gets
+        the same ratio in both modes. Droplets which get brighter are counted with the saturated differences
+        of the other direction, so the noise stays at the level of the BGR mode,
+        see Benchmark_VODCA_eng.grayscale_calibration.
+
+        Parameters
+        ----------
+        image1 : numpy array
+            first image
+        image2 : numpy array
+            second image
+        droplets : numpy array, optional
+            boolean mask of the droplets which are evaluated, the others get a ratio of 0.
+            The default is None, all active droplets.
+
+        Returns
+        -------
+        ratios : numpy array
+            sum of differences/ Area for every droplet
+
+        """
+        return self.sums_to_ratios(self.difference_sums(image1, image2, droplets),
+                                   image1.shape[2] if image1.ndim == 3 else 1)
+
+
+def ratio_paths(folder_directory, filename):
+    return (os.path.join(folder_directory, f'ratios_{filename}.npy'),
+            os.path.join(folder_directory, f'ratio_temperatures_{filename}.npy'))
+
+
+class RatioStore:
+    """
+    memory-mapped droplets x frames matrix with the sum of differences/ Area of every droplet and pair of frames,
+    so the freezing can be classified again with another threshold without decoding the images
+    """
+
+    def __init__(self, folder_directory, filename, n_droplets, n_pairs, resume=False):
+        """
+        Parameters
+        ----------
+        folder_directory : str
+            path to the main folder
+        filename : str
+            name of the subfolder
+        n_droplets : int
+            number of droplets
+        n_pairs : int
+            number of pairs of frames
+        resume : bool, optional
+            keep the ratios of an existing store with the same shape. The default is False.
+
+        """
+        ratio_path, temperature_path = ratio_paths(folder_directory, filename)
+        if resume and os.path.exists(ratio_path) and os.path.exists(temperature_path):
+            self.ratios = np.load(ratio_path, mmap_mode='r+')
+            self.temperatures = np.load(temperature_path, mmap_mode='r+')
+            if self.ratios.shape == (n_droplets, n_pairs):
+                return
+
+        # pairs of frames which are not evaluated stay nan
+        self.ratios = np.lib.format.open_memmap(ratio_path, mode='w+', dtype=np.float32, shape=(n_droplets, n_pairs))
+        self.ratios[:] = np.nan
+        self.temperatures = np.lib.format.open_memmap(temperature_path, mode='w+', dtype=np.float64, shape=(n_pairs,))
+        self.temperatures[:] = np.nan
+
+    def record(self, i, temperature, ratios):
+        """
+        saves the ratios of all droplets of the pair of frames i, i+1
+        """
+        self.ratios[:, i] = ratios
+        self.temperatures[i] = temperature
+
+    def flush(self):
+        self.ratios.flush()
+        self.temperatures.flush()
+
+
+def load_ratios(folder_directory, filename):
+    """
+    loads the ratio matrix and the temperatures of a subfolder read-only
+
+    Returns
+    -------
+    ratios : numpy memmap
+        droplets x pairs of frames
+    temperatures : numpy memmap
+        temperature of the second frame of every pair
+
+    """
+    ratio_path, temperature_path = ratio_paths(folder_directory, filename)
+    return np.load(ratio_path, mmap_mode='r'), np.load(temperature_path, mmap_mode='r')
+
+
+def classify_ratios(ratios, temperatures, threshold=50, evaluated=None):
+    """
+    finds the freezing temperature of every droplet: the first pair of frames where the ratio exceeds the threshold
+
+    Parameters
+    ----------
+    ratios : numpy array
+        droplets x pairs of frames
+    temperatures : numpy array
+        temperature of the second frame of every pair
+    threshold : float, optional
+        droplets with a higher sum of differences/ Area are detected as frozen. The default is 50.
+    evaluated : numpy array, optional
+        boolean mask of the droplets which are evaluated at all. The default is None (all droplets).
+
+    Returns
+    -------
+    freeze_temperatures : numpy array
+        freezing temperature of every droplet, nan for droplets which did not freeze
+
+    """
+    with np.errstate(invalid='ignore'):
+        exceeded = np.asarray(ratios) > threshold
+    if exceeded.shape[1] == 0:
+        return np.full(len(exceeded), np.nan)
+    first = np.argmax(exceeded, axis=1)
+    frozen = exceeded[np.arange(len(exceeded)), first]
+    if evaluated is not None:
+        frozen &= evaluated
+    return np.where(frozen, np.asarray(temperatures)[first], np.nan)
+
+
+def freeze_events(freeze_temperatures, contours):
+    """
+    groups the frozen droplets by temperature like the rows of the csv file
+
+    Parameters
+    ----------
+    freeze_temperatures : numpy array
+        freezing temperature of every droplet, nan for droplets which did not freeze
+    contours : numpy array
+        contains x, y coordinates and radius of the droplets
+
+    Returns
+    -------
+    rows : list
+        temperature, number of frozen droplets and radii (mu) of every temperature with frozen droplets
+
+    """
+    frozen = np.flatnonzero(~np.isnan(freeze_temperatures))
+    frozen = frozen[np.argsort(freeze_temperatures[frozen], kind='stable')]
+    temperatures, starts, counts = np.unique(freeze_temperatures[frozen], return_index=True, return_counts=True)
+    radii = np.round(np.asarray(contours)[frozen, 2].astype(float)/49*15).astype(int)
+    return [[temperature, count, radii[start:start + count]]
+            for temperature, start, count in zip(temperatures, starts, counts)]
+
+
+def reclassify(folder_directory, filename, contours, threshold=50):
+    """
+    classifies the freezing of a subfolder again with another threshold, using the saved ratio matrix
+
+    Parameters
+    ----------
+    folder_directory : str
+        path to the main folder
+    filename : str
+        name of the subfolder
+    contours : numpy array
+        contains x, y coordinates and radius of the droplets
+    threshold : float, optional
+        droplets with a higher sum of differences/ Area are detected as frozen. The default is 50.
+
+    Returns
+    -------
+    rows : list
+        temperature, number of frozen droplets and radii (mu), see freeze_events
+
+    """
+    ratios, temperatures = load_ratios(folder_directory, filename)
+    freeze_temperatures = classify_ratios(ratios, temperatures, threshold, droplet_mask(contours)[:, 0] == 1)
+    return freeze_events(freeze_temperatures, contours)
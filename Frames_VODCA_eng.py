@@ -0,0 +1,531 @@
+import os
+import re
+import csv
+import json
+import threading
+import numpy as np
+import cv2 as cv
+from PIL import Image
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import Timing_VODCA_eng
+
+
+class StackFrame(str):
+    """
+    one frame of a multi-page TIFF stack or a video, it is used like the path of an image in all_images.
+    The string is 'path[frame]', so it can be printed and saved like a path.
+    """
+
+    def __new__(cls, path, frame):
+        self = super().__new__(cls, f'{path}[{frame}]')
+        self.path = path
+        self.frame = int(frame)
+        return self
+
+    def __getnewargs__(self):
+        return self.path, self.frame
+
+
+def to_uint8(image):
+    # 16 bit stacks are scaled from the full 16 bit range, the analysis works with 8 bit images
+    if image.dtype == np.uint16:
+        return (image // 257).astype(np.uint8)
+    return image
+
+
+class TiffStackReader:
+    """
+    reads the pages of a multi-page TIFF file, the file stays open between the frames
+    """
+
+    def __init__(self, path):
+        self.image = Image.open(path)
+
+    def read(self, frame, gray=False):
+        """
+        returns the frame as BGR image or as gray image
+        """
+        self.image.seek(frame)
+        image = self.image
+        if gray and image.mode not in ('L', 'I;16', 'I;16B'):
+            image = image.convert('L')
+        image = to_uint8(np.array(image))
+        if gray or image.ndim == 2:
+            return image if gray else cv.cvtColor(image, cv.COLOR_GRAY2BGR)
+        return cv.cvtColor(image, cv.COLOR_RGB2BGR)
+
+    def close(self):
+        self.image.close()
+
+
+class VideoReader:
+    """
+    reads the frames of a video with cv.VideoCapture, the frames are read one after another and the video
+    is only searched if a frame is skipped
+    """
+
+    def __init__(self, path):
+        self.capture = cv.VideoCapture(path)
+        if not self.capture.isOpened():
+            raise ValueError(f'{path} can not be opened')
+        self.position = 0
+
+    def read(self, frame, gray=False):
+        """
+        returns the frame as BGR image or as gray image
+        """
+        if frame != self.position:
+            self.capture.set(cv.CAP_PROP_POS_FRAMES, frame)
+        ok, image = self.capture.read()
+        if not ok:
+            raise ValueError(f'frame {frame} can not be read')
+        self.position = frame + 1
+        return cv.cvtColor(image, cv.COLOR_BGR2GRAY) if gray else image
+
+    def close(self):
+        self.capture.release()
+
+
+# reader of every file extension, other containers can be added here
+READERS = {'.tif': TiffStackReader, '.tiff': TiffStackReader,
+           '.avi': VideoReader, '.mp4': VideoReader, '.mov': VideoReader, '.mkv': VideoReader}
+
+# the open readers, every file is opened once and its frames are read one after another
+open_readers = {}
+readers_lock = threading.Lock()
+
+
+def read_stack_frame(image_file, gray=False):
+    """
+    reads a frame of a TIFF stack or video with the open reader of the file
+
+    Parameters
+    ----------
+    image_file : StackFrame
+        file and frame number
+    gray : bool, optional
+        returns a gray image instead of a BGR image. The default is False.
+
+    Returns
+    -------
+    image : numpy.ndarray
+        BGR or gray image
+
+    """
+    with readers_lock:
+        if image_file.path not in open_readers:
+            reader = READERS[os.path.splitext(image_file.path)[1].lower()](image_file.path)
+            open_readers[image_file.path] = (reader, threading.Lock())
+        reader, lock = open_readers[image_file.path]
+
+    # the prefetching threads share the reader
+    with lock:
+        return reader.read(image_file.frame, gray=gray)
+
+
+def close_readers(all_images):
+    """
+    closes the readers of the TIFF stacks and videos of all_images
+    """
+    paths = {image.path for image in all_images if isinstance(image, StackFrame)}
+    with readers_lock:
+        for path in paths & open_readers.keys():
+            open_readers.pop(path)[0].close()
+
+
+def frame_file(image, folder_directory):
+    """
+    the contour detection needs an image file, a frame of a stack is saved as frame_<subfolder>_<stack>_<n>.png
+    in the main folder. The file is written again if the stack is newer.
+
+    Parameters
+    ----------
+    image : str
+        path to an image or a StackFrame
+    folder_directory : str
+        path to the main folder
+
+    Returns
+    -------
+    path : str
+        path to the image file
+
+    """
+    if not isinstance(image, StackFrame):
+        return image
+    # stacks with the same name in different subfolders get different files
+    subfolder = os.path.basename(os.path.dirname(os.path.abspath(image.path)))
+    name = os.path.splitext(os.path.basename(image.path))[0]
+    path = os.path.join(folder_directory, f'frame_{subfolder}_{name}_{image.frame}.png')
+    if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(image.path):
+        cv.imwrite(path, load_image(image))
+        close_readers([image])
+    return path
+
+
+def load_image(image_file):
+    """
+    decodes an image to a BGR numpy array
+
+    Parameters
+    ----------
+    image_file : str
+        path to the image or a StackFrame
+
+    Returns
+    -------
+    image : numpy.ndarray
+        BGR image as used by cv2
+
+    """
+    if isinstance(image_file, StackFrame):
+        with Timing_VODCA_eng.stage('decode'):
+            return read_stack_frame(image_file)
+
+    with Timing_VODCA_eng.stage('decode'):
+        with Image.open(image_file) as image:
+            image = np.array(image)
+    if Timing_VODCA_eng.enabled():
+        Timing_VODCA_eng.count('bytes_read', os.path.getsize(image_file))
+
+    with Timing_VODCA_eng.stage('cvtColor'):
+        return cv.cvtColor(image, cv.COLOR_RGB2BGR)
+
+
+def load_gray(image_file, reduce=1):
+    """
+    decodes an image directly to a gray uint8 numpy array, JPEG images are decoded at a reduced size if
+    reduce is larger than 1, which needs less memory and time than decoding them at full size
+
+    Parameters
+    ----------
+    image_file : str
+        path to the image or a StackFrame
+    reduce : int, optional
+        the width and height are divided by this factor (1, 2, 4 or 8). The default is 1.
+
+    Returns
+    -------
+    image : numpy.ndarray
+        gray image
+
+    """
+    if isinstance(image_file, StackFrame):
+        with Timing_VODCA_eng.stage('decode'):
+            image = read_stack_frame(image_file, gray=True)
+            if reduce > 1:
+                height, width = image.shape
+                image = cv.resize(image, (width // reduce, height // reduce), interpolation=cv.INTER_AREA)
+        return image
+
+    with Timing_VODCA_eng.stage('decode'):
+        with Image.open(image_file) as image:
+            size = (image.width // reduce, image.height // reduce)
+            image.draft('L', size)
+            if image.mode != 'L':
+                image = image.convert('L')
+
+            # draft only works for JPEG images and only with the factors 2, 4 and 8
+            if image.size != size:
+                image = image.resize(size, Image.BILINEAR)
+            image = np.asarray(image)
+    if Timing_VODCA_eng.enabled():
+        Timing_VODCA_eng.count('bytes_read', os.path.getsize(image_file))
+    return image
+
+
+class FrameSource:
+    """
+    gives access to the decoded frames of an image series,
+    the last decoded frames are kept in a small cache so every image is only decoded once
+    """
+
+    def __init__(self, all_images, cache_size=2, decoder=load_image):
+        self.all_images = all_images
+        self.cache_size = cache_size
+        self.decoder = decoder
+        self.cache = OrderedDict()
+
+    def __len__(self):
+        return len(self.all_images)
+
+    def get(self, i):
+        """
+        returns the decoded frame i
+
+        Parameters
+        ----------
+        i : int
+            index of the image in all_images
+
+        Returns
+        -------
+        frame : numpy.ndarray
+            decoded image
+
+        """
+        if i in self.cache:
+            self.cache.move_to_end(i)
+            return self.cache[i]
+
+        frame = self.decoder(self.all_images[i])
+        self.cache[i] = frame
+
+        # the oldest frames are thrown away, so the memory stays bounded
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return frame
+
+    def close(self):
+        self.cache.clear()
+        close_readers(self.all_images)
+
+
+class PrefetchFrameSource(FrameSource):
+    """
+    frame source which decodes the next frames on worker threads while the current pair of frames is analysed,
+    at most n_prefetch frames are decoded in advance so the memory stays bounded
+    """
+
+    def __init__(self, all_images, n_prefetch=4, workers=None, cache_size=2, decoder=load_image):
+        super().__init__(all_images, cache_size=cache_size, decoder=decoder)
+        self.n_prefetch = n_prefetch
+        self.executor = ThreadPoolExecutor(max_workers=workers or n_prefetch)
+        self.pending = {}
+
+    def get(self, i):
+        """
+        returns the decoded frame i and starts decoding the following frames
+
+        Parameters
+        ----------
+        i : int
+            index of the image in all_images
+
+        Returns
+        -------
+        frame : numpy.ndarray
+            decoded image
+
+        """
+        if i in self.cache:
+            self.cache.move_to_end(i)
+            frame = self.cache[i]
+        else:
+            future = self.pending.pop(i, None)
+            if future is None:
+                future = self.executor.submit(self.decoder, self.all_images[i])
+            frame = future.result()
+            self.cache[i] = frame
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+        # frames behind the current one are not needed anymore
+        for j in [j for j in self.pending if j < i]:
+            self.pending.pop(j).cancel()
+
+        # the queue is filled up with the next frames
+        for j in range(i + 1, min(i + 1 + self.n_prefetch, len(self.all_images))):
+            if j not in self.cache and j not in self.pending:
+                self.pending[j] = self.executor.submit(self.decoder, self.all_images[j])
+        return frame
+
+    def close(self):
+        for future in self.pending.values():
+            future.cancel()
+        self.pending.clear()
+        self.executor.shutdown(wait=True)
+        super().close()
+
+
+def parse_temperature(image):
+    """
+    searches for the temperature in the name of the image, format: number + either ',' '.' + number
+
+    Parameters
+    ----------
+    image : str
+        path to the image
+
+    Returns
+    -------
+    temperature : float or None
+        None if the name contains no temperature
+
+    """
+    temperature_match = re.search(r"\d+[\,\.]\d+", os.path.basename(image))
+    if temperature_match:
+        return float(temperature_match.group().replace(',', '.'))
+    return None
+
+
+def sidecar_path(stack):
+    return os.path.splitext(stack)[0] + '.csv'
+
+
+def read_sidecar(path):
+    """
+    reads the temperature table of a TIFF stack or video, the table has a header with the columns temperature and
+    optionally frame (without it the rows belong to the frames 0, 1, 2, ...). The columns are separated by ',', ';'
+    or tabs, with ';' or tabs the decimal separator can be ','. The temperature is taken like in the names of the
+    images: as degree Celsius below zero, the sign is ignored.
+
+    Parameters
+    ----------
+    path : str
+        path to the table
+
+    Returns
+    -------
+    frames : list
+        pairs of frame number and temperature, the temperature is None if it can not be read
+
+    """
+    with open(path, newline='') as file:
+        sample = file.read(4096)
+        file.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+        except csv.Error:
+            # a table with only one column has no delimiter
+            dialect = csv.excel
+        rows = [row for row in csv.reader(file, dialect) if row]
+
+    header = [column.strip().lower() for column in rows[0]]
+    if 'temperature' not in header:
+        raise ValueError(f'{path} has no column temperature')
+    temperature_column = header.index('temperature')
+    frame_column = header.index('frame') if 'frame' in header else None
+
+    frames = []
+    for i, row in enumerate(rows[1:]):
+        frame = int(row[frame_column]) if frame_column is not None else i
+        try:
+            temperature = abs(float(row[temperature_column].strip().replace(',', '.')))
+        except (ValueError, IndexError):
+            temperature = None
+        frames.append((frame, temperature))
+    return frames
+
+
+def find_stacks(directory):
+    """
+    names of the TIFF stacks and videos of a subfolder which have a temperature table with the same name
+    """
+    return sorted(entry.name for entry in os.scandir(directory)
+                  if os.path.splitext(entry.name)[1].lower() in READERS and entry.is_file()
+                  and os.path.exists(sidecar_path(entry.path)))
+
+
+def frame_index_path(folder_directory, filename):
+    return os.path.join(folder_directory, f'frame_index_{filename}.json')
+
+
+def build_frame_index(folder_directory, filename, extension='.jpg', gap_factor=3, refresh=False):
+    """
+    lists the images of a subfolder once, parses their temperatures and sorts them by temperature.
+    The index is saved in frame_index_<name>.json and used again as long as the subfolder does not change.
+    If the subfolder contains TIFF stacks or videos with a temperature table (see read_sidecar), their frames
+    are used instead of the images.
+
+    Parameters
+    ----------
+    folder_directory : str
+        path to the main folder
+    filename : str
+        name of the subfolder
+    extension : str, optional
+        file extension of the images. The default is '.jpg'.
+    gap_factor : float, optional
+        steps between two temperatures which are this many times larger than the usual (median) step are
+        reported as gaps. The default is 3.
+    refresh : bool, optional
+        list the subfolder again even if the saved index is up to date. The default is False.
+
+    Returns
+    -------
+    index : dict
+        images (sorted paths or StackFrames), temperatures, duplicates (temperatures which occur more than once),
+        gaps (pairs of temperatures with missing images in between) and invalid (images without temperature)
+
+    """
+    directory = os.path.join(folder_directory, filename)
+    path = frame_index_path(folder_directory, filename)
+
+    # adding, removing or renaming an image changes the modification time of the subfolder
+    modified = os.stat(directory).st_mtime_ns
+    manifest = None
+    if not refresh and os.path.exists(path):
+        with open(path) as file:
+            manifest = json.load(file)
+        if manifest.get('modified') != modified or manifest.get('extension') != extension:
+            manifest = None
+        # the temperature tables can be changed without changing the subfolder
+        elif any(os.stat(os.path.join(directory, name)).st_mtime_ns != sidecar_modified
+                 for name, sidecar_modified in manifest.get('sidecars', {}).items()):
+            manifest = None
+
+    stacks = find_stacks(directory) if manifest is None else []
+    if stacks:
+        frames = []
+        invalid = []
+        for name in stacks:
+            for frame, temperature in read_sidecar(sidecar_path(os.path.join(directory, name))):
+                if temperature is None:
+                    invalid.append(f'{name}[{frame}]')
+                else:
+                    frames.append((temperature, name, frame))
+        frames.sort()
+        sidecars = [os.path.basename(sidecar_path(name)) for name in stacks]
+        manifest = {'modified': modified, 'extension': extension,
+                    'sidecars': {name: os.stat(os.path.join(directory, name)).st_mtime_ns for name in sidecars},
+                    'names': [name for temperature, name, frame in frames],
+                    'frames': [frame for temperature, name, frame in frames],
+                    'temperatures': [temperature for temperature, name, frame in frames],
+                    'invalid': invalid}
+        with open(path, 'w') as file:
+            json.dump(manifest, file)
+
+    if manifest is None:
+        # the extension is compared in lower case like glob does on Windows, cameras often write .JPG
+        names = [entry.name for entry in os.scandir(directory)
+                 if entry.name.lower().endswith(extension.lower()) and entry.is_file()]
+        temperatures = [parse_temperature(name) for name in names]
+        invalid = sorted(name for name, temperature in zip(names, temperatures) if temperature is None)
+        frames = sorted((temperature, name) for name, temperature in zip(names, temperatures) if temperature is not None)
+        manifest = {'modified': modified, 'extension': extension,
+                    'names': [name for temperature, name in frames],
+                    'temperatures': [temperature for temperature, name in frames],
+                    'invalid': invalid}
+        with open(path, 'w') as file:
+            json.dump(manifest, file)
+
+    temperatures = np.array(manifest['temperatures'], dtype=float)
+    steps = np.diff(temperatures)
+    duplicates = np.unique(temperatures[1:][steps == 0]).tolist()
+    gaps = []
+    if np.any(steps > 0):
+        usual_step = np.median(steps[steps > 0])
+        gaps = [(temperatures[i], temperatures[i + 1]) for i in np.flatnonzero(steps > gap_factor * usual_step)]
+
+    if 'frames' in manifest:
+        images = [StackFrame(os.path.join(directory, name), frame)
+                  for name, frame in zip(manifest['names'], manifest['frames'])]
+    else:
+        images = [os.path.join(directory, name) for name in manifest['names']]
+    return {'images': images,
+            'temperatures': temperatures, 'duplicates': duplicates, 'gaps': gaps,
+            'invalid': [os.path.join(directory, name) for name in manifest['invalid']]}
+
+
+def report_frame_index(index):
+    """
+    prints the problems found while the frame index was built
+    """
+    if index['invalid']:
+        print(f'{len(index["invalid"])} images without temperature in the name are ignored: {index["invalid"][:5]}')
+    if index['duplicates']:
+        print(f'several images with the same temperature: {index["duplicates"]}')
+    for temperature1, temperature2 in index['gaps']:
+        print(f'images are missing between {temperature1} and {temperature2}')
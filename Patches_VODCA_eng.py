@@ -0,0 +1,180 @@
+import os
+import functools
+import numpy as np
+import Frames_VODCA_eng
+import Droplets_VODCA_eng
+
+
+def patch_paths(folder_directory, filename):
+    return (os.path.join(folder_directory, f'patches_{filename}.npy'),
+            os.path.join(folder_directory, f'patch_index_{filename}.npz'))
+
+
+def extract_patches(all_images, temperatures, folder_directory, filename, contours, prefetch=0, grayscale=False,
+                    reduce=1):
+    """
+    cuts out the pixels of all droplets of all images once and saves them in a memory-mapped array,
+    so later analyses do not have to decode the images again.
+
+    The images are decoded like in the analysis they are extracted for, so reanalyse reproduces its ratios.
+    In the grayscale mode one gray value is saved per pixel instead of three.
+
+    Parameters
+    ----------
+    all_images : list
+        paths to the images
+    temperatures : list
+        temperature of every image
+    folder_directory : str
+        path to the main folder
+    filename : str
+        name of the subfolder
+    contours : numpy array
+        contains x, y coordinates and radius of the droplets
+    prefetch : int, optional
+        number of images which are decoded in advance. The default is 0.
+    grayscale : bool, optional
+        save gray pixels like the grayscale mode of the analysis, False saves the three channels of the BGR images.
+        The default is False.
+    reduce : int, optional
+        the gray images are decoded at 1/reduce of their size. The default is 1.
+
+    Returns
+    -------
+    stack : PatchStack
+        the extracted pixels
+
+    """
+    decoder = Frames_VODCA_eng.load_image
+    if grayscale:
+        decoder = functools.partial(Frames_VODCA_eng.load_gray, reduce=reduce)
+    else:
+        reduce = 1
+    if prefetch > 0:
+        frames = Frames_VODCA_eng.PrefetchFrameSource(all_images, n_prefetch=prefetch, decoder=decoder)
+    else:
+        frames = Frames_VODCA_eng.FrameSource(all_images, decoder=decoder)
+
+    patch_path, index_path = patch_paths(folder_directory, filename)
+    contours = np.asarray(contours, dtype=float)[:, :3]
+    try:
+        first = frames.get(0)
+        label_map = Droplets_VODCA_eng.DropletLabelMap(contours, first.shape, absolute=grayscale, reduce=reduce)
+        channels = first.shape[2] if first.ndim == 3 else 1
+
+        # only the pixels inside of the droplets are saved: frames x pixels of all droplets x channels
+        patches = np.lib.format.open_memmap(patch_path, mode='w+', dtype=np.uint8,
+                                            shape=(len(all_images), len(label_map.pixels), channels))
+        for i in range(len(all_images)):
+            patches[i] = label_map.gather(frames.get(i))
+        patches.flush()
+        del patches
+    finally:
+        frames.close()
+
+    np.savez(index_path, contours=contours, shape=np.array(first.shape),
+             temperatures=np.asarray(temperatures, dtype=float), images=np.array(all_images, dtype=str),
+             grayscale=grayscale, reduce=reduce)
+    print(f'pixels of {len(contours)} droplets in {len(all_images)} images are saved in {patch_path} '
+          f'({os.path.getsize(patch_path) / 1e6:.1f} MB)')
+    return PatchStack(folder_directory, filename)
+
+
+class PatchStack:
+    """
+    read-only access to the droplet pixels saved by extract_patches
+    """
+
+    def __init__(self, folder_directory, filename):
+        """
+        Parameters
+        ----------
+        folder_directory : str
+            path to the main folder
+        filename : str
+            name of the subfolder
+
+        """
+        patch_path, index_path = patch_paths(folder_directory, filename)
+        self.patches = np.load(patch_path, mmap_mode='r')
+        with np.load(index_path) as index:
+            self.contours = index['contours']
+            self.temperatures = index['temperatures']
+            self.images = index['images']
+            shape = tuple(index['shape'])
+            # the patches of older versions are always BGR pixels at full size
+            self.grayscale = bool(index['grayscale']) if 'grayscale' in index.files else False
+            self.reduce = int(index['reduce']) if 'reduce' in index.files else 1
+
+        # the label map is built again, it sorts the pixels the same way as during the extraction
+        self.label_map = Droplets_VODCA_eng.DropletLabelMap(self.contours, shape, absolute=self.grayscale,
+                                                            reduce=self.reduce)
+
+    def __len__(self):
+        return len(self.patches)
+
+    def droplet(self, j):
+        """
+        pixels of droplet j in all frames
+
+        Returns
+        -------
+        pixels : numpy array
+            frames x pixels of the droplet x channels
+
+        """
+        start = int(np.cumsum(self.label_map.area)[j] - self.label_map.area[j])
+        return self.patches[:, start:start + self.label_map.area[j]]
+
+    def ratios(self, i):
+        """
+        sum of differences/ Area of every droplet between the frames i and i+1
+        """
+        sums = self.label_map.gathered_difference_sums(self.patches[i], self.patches[i + 1])
+        return self.label_map.sums_to_ratios(sums, self.patches.shape[2])
+
+    def ratio_matrix(self):
+        """
+        ratios of all droplets and pairs of frames up to the first decrease of the temperature,
+        the same pairs of frames main evaluates
+
+        Returns
+        -------
+        ratios : numpy array
+            droplets x pairs of frames
+        temperatures : numpy array
+            temperature of the second frame of every pair
+
+        """
+        decreasing = np.flatnonzero(np.diff(self.temperatures) < 0)
+        n_pairs = decreasing[0] if len(decreasing) else len(self) - 1
+        ratios = np.empty((len(self.contours), n_pairs), dtype=np.float32)
+        for i in range(n_pairs):
+            ratios[:, i] = self.ratios(i)
+        return ratios, self.temperatures[1:n_pairs + 1]
+
+
+def reanalyse(folder_directory, filename, threshold=50):
+    """
+    counts the frozen droplets of a subfolder with the saved droplet pixels instead of the images
+
+    Parameters
+    ----------
+    folder_directory : str
+        path to the main folder
+    filename : str
+        name of the subfolder
+    threshold : float, optional
+        droplets with a higher sum of differences/ Area are detected as frozen. The default is 50.
+
+    Returns
+    -------
+    rows : list
+        temperature, number of frozen droplets and radii (mu) of every temperature with frozen droplets
+
+    """
+    stack = PatchStack(folder_directory, filename)
+    ratios, temperatures = stack.ratio_matrix()
+    evaluated = ~Droplets_VODCA_eng.excluded_droplets(stack.contours)
+    freeze_temperatures = Droplets_VODCA_eng.classify_ratios(ratios, temperatures, threshold, evaluated)
+    return Droplets_VODCA_eng.freeze_events(freeze_temperatures, stack.contours)
@@ -0,0 +1,205 @@
+import os
+import csv
+import numpy as np
+import Timing_VODCA_eng
+
+
+OUTPUTS = ('csv', 'npz', 'both')
+
+
+def csv_path(folder_directory, filename):
+    return os.path.join(folder_directory, f'droplets_{filename}.csv')
+
+
+def npz_path(folder_directory, filename):
+    return os.path.join(folder_directory, f'droplets_{filename}.npz')
+
+
+def pt_to_mu(radius):
+    # the radii are saved in mu like in the csv file
+    return np.round(np.asarray(radius, dtype=float)/49*15).astype(int)
+
+
+def freeze_steps_of(freeze_temperatures, temperatures):
+    """
+    finds the row of every frozen droplet by its freezing temperature, for result files and checkpoints
+    which have no rows of the droplets. Droplets of a temperature which occurs in several rows get the first one.
+
+    Parameters
+    ----------
+    freeze_temperatures : numpy array
+        freezing temperature of every droplet, nan for liquid droplets
+    temperatures : numpy array
+        temperature of every row
+
+    Returns
+    -------
+    freeze_steps : numpy array
+        row of every droplet, -1 for liquid droplets
+
+    """
+    freeze_temperatures = np.asarray(freeze_temperatures, dtype=float)
+    temperatures = np.asarray(temperatures, dtype=float)
+    freeze_steps = np.full(len(freeze_temperatures), -1)
+    frozen = ~np.isnan(freeze_temperatures)
+    if len(temperatures):
+        order = np.argsort(temperatures, kind='stable')
+        positions = np.searchsorted(temperatures[order], freeze_temperatures[frozen])
+        freeze_steps[frozen] = order[np.minimum(positions, len(temperatures) - 1)]
+    return freeze_steps
+
+
+class ResultWriter:
+    """
+    collects the frozen droplets of a subfolder and writes them as csv rows and/or as typed arrays in a npz file,
+    the csv rows are buffered and appended with one file access per flush
+    """
+
+    def __init__(self, folder_directory, filename, output='csv', rows=(), buffer_size=50):
+        """
+        Parameters
+        ----------
+        folder_directory : str
+            path to the main folder
+        filename : str
+            name of the subfolder
+        output : str, optional
+            'csv', 'npz' or 'both'. The default is 'csv'.
+        rows : list, optional
+            rows which were already written (when an analysis is resumed). The default is ().
+        buffer_size : int, optional
+            number of rows which are collected before they are appended to the csv file. The default is 50.
+
+        """
+        if output not in OUTPUTS:
+            raise ValueError(f'output has to be one of {OUTPUTS}, not {output!r}')
+        self.folder_directory = folder_directory
+        self.filename = filename
+        self.output = output
+        self.rows = [list(row) for row in rows]
+        self.buffer = []
+        self.buffer_size = buffer_size
+
+    def write_row(self, temperature, n, array_radius):
+        """
+        adds the frozen droplets of one temperature step
+
+        Parameters
+        ----------
+        temperature : float
+            temperature.
+        n : int
+            number of frozen droplets
+        array_radius : np.array
+            radii of the frozen droplets in mu
+
+        Returns
+        -------
+        None.
+
+        """
+        row = [str(temperature), str(n), str(array_radius)]
+        self.rows.append(row)
+        if self.output in ('csv', 'both'):
+            self.buffer.append(row)
+            if len(self.buffer) >= self.buffer_size:
+                self.flush()
+
+    def flush(self):
+        """
+        appends the buffered rows to the csv file
+        """
+        if self.buffer:
+            with Timing_VODCA_eng.stage('csv'):
+                with open(csv_path(self.folder_directory, self.filename), mode='a', newline='') as file:
+                    csv.writer(file).writerows(self.buffer)
+            self.buffer = []
+
+    def save(self, contours_YN, freeze_temperatures, evaluated=None, freeze_steps=None):
+        """
+        flushes the csv rows and writes the npz file
+
+        the npz file contains one entry per temperature step (temperature, n_frozen) and
+        one entry per droplet (x, y, radius in pt, radius_mu, freeze_temperature (nan for liquid droplets),
+        freeze_step (the step the droplet froze in, -1 for liquid droplets), evaluated)
+
+        Parameters
+        ----------
+        contours_YN : numpy array
+            x, y coordinates, radius and mask of the droplets
+        freeze_temperatures : numpy array
+            freezing temperature of every droplet, nan for liquid droplets
+        evaluated : numpy array, optional
+            boolean mask of the droplets which are evaluated at all. The default is None (all droplets).
+        freeze_steps : numpy array, optional
+            row every droplet was written to, -1 for liquid droplets. The default is None, the steps are found
+            by the freezing temperatures.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.flush()
+        if self.output not in ('npz', 'both'):
+            return
+
+        contours_YN = np.asarray(contours_YN, dtype=float)
+        if evaluated is None:
+            evaluated = np.ones(len(contours_YN), dtype=bool)
+        rows = np.array(self.rows, dtype=str).reshape(-1, 3)
+        if freeze_steps is None:
+            freeze_steps = freeze_steps_of(freeze_temperatures, rows[:, 0].astype(float))
+        with Timing_VODCA_eng.stage('npz'):
+            np.savez(npz_path(self.folder_directory, self.filename),
+                     temperature=rows[:, 0].astype(float),
+                     n_frozen=rows[:, 1].astype(int),
+                     x=contours_YN[:, 0].astype(np.int32),
+                     y=contours_YN[:, 1].astype(np.int32),
+                     radius=contours_YN[:, 2].astype(np.int32),
+                     radius_mu=pt_to_mu(contours_YN[:, 2]).astype(np.int32),
+                     freeze_temperature=np.asarray(freeze_temperatures, dtype=float),
+                     freeze_step=np.asarray(freeze_steps, dtype=np.int32),
+                     evaluated=np.asarray(evaluated, dtype=bool))
+
+
+def read_npz(path):
+    """
+    reads a npz result file
+
+    Parameters
+    ----------
+    path : str
+        path to droplets_<name>.npz
+
+    Returns
+    -------
+    temperatures : numpy array
+        temperature steps with frozen droplets
+    n_frozen : numpy array
+        number of frozen droplets of every step
+    radii : list
+        numpy arrays with the radii (mu) of the droplets frozen in every step
+
+    """
+    with np.load(path) as results:
+        temperatures = results['temperature']
+        n_frozen = results['n_frozen']
+        freeze_temperature = results['freeze_temperature']
+        radius_mu = results['radius_mu']
+        # files of older versions have no steps of the droplets, they are found by the freezing temperatures
+        if 'freeze_step' in results.files:
+            freeze_step = results['freeze_step']
+        else:
+            freeze_step = freeze_steps_of(freeze_temperature, temperatures)
+
+    if len(temperatures) == 0:
+        return temperatures, n_frozen, []
+
+    # the droplets are grouped by the step they froze in, within a step they keep their order,
+    # so droplets of a temperature which occurs in several steps stay in their own step
+    frozen = np.flatnonzero(freeze_step >= 0)
+    frozen = frozen[np.argsort(freeze_step[frozen], kind='stable')]
+    counts = np.bincount(freeze_step[frozen], minlength=len(temperatures))[:len(temperatures)]
+    radii = np.split(radius_mu[frozen], np.cumsum(counts)[:-1])
+    return temperatures, n_frozen, radii
@@ -4,12 +4,339 @@ from PIL import Image, ImageFilter, ImageEnhance
 import matplotlib.pyplot as plt
 from matplotlib.widgets import Slider
 import os
+import json
+import Timing_VODCA_eng
+
+
+# initial values of the contour detection, minsize and maxsize are radii in pt,
+# scale > 1 detects the droplets in an image downscaled by this factor and refines them in the full image
+DEFAULT_PARAMETERS = {'param1': 12, 'param2': 25, 'minsize': 49, 'maxsize': 140, 'scale': 1}
+
+
+# time in ms the sliders have to rest before the contours are detected again
+DEBOUNCE_INTERVAL = 150
+
+
+def rename_image(image_path):
+    """
+    removes the degree sign from the image path, PIL Image.open can not work with str containing it
+
+    Parameters
+    ----------
+    image_path : str
+        path to the image
+
+    Returns
+    -------
+    newstr : str
+        new path to the image
+
+    """
+    newstr = image_path.replace('\u00B0', "")
+    os.rename(image_path, newstr)
+    return newstr
+
+
+def odd_kernel(size, scale):
+    # kernel sizes of the filters shrink with the image, they have to stay odd
+    return max(int(size / scale) // 2 * 2 + 1, 3)
+
+
+def preprocess_gray(gray_image1, scale=1):
+    """
+    downscales the enhanced gray image by scale and turns it into the black-white image
+    """
+    if scale > 1:
+        height, width = gray_image1.shape
+        gray_image1 = cv.resize(gray_image1, (width // scale, height // scale), interpolation=cv.INTER_AREA)
+    return threshold_image(gray_image1, scale)
+
+
+def enhance_image(image_path):
+    """
+    blurs the image and enhances the contrast
+
+    Returns
+    -------
+    image_1 : numpy.ndarray
+        BGR image the detected droplets are drawn in
+    gray_image1 : numpy.ndarray
+        enhanced gray image
+
+    """
+    image_1 = cv.imread(image_path)
+    image_to_be_enhanced = Image.open(image_path)
+
+    # blurs the image and enhances the contrast
+    image_to_be_enhanced = image_to_be_enhanced.filter(ImageFilter.BLUR)
+    enhancer = ImageEnhance.Contrast(image_to_be_enhanced)
+    enhanced_image = enhancer.enhance(2)
+
+    # cv2 and PIL use different data types, so now the PIL image is transformed
+    gray_image1 = cv.cvtColor(np.array(enhanced_image), cv.COLOR_RGB2GRAY)
+    return image_1, gray_image1
+
+
+def threshold_image(gray_image1, scale=1):
+    """
+    turns the enhanced gray image into the black-white image the contours are detected in
+
+    Parameters
+    ----------
+    gray_image1 : numpy.ndarray
+        enhanced gray image
+    scale : int, optional
+        the gray image is downscaled by this factor, the kernels of the filters shrink accordingly. The default is 1.
+
+    Returns
+    -------
+    thresh_image : numpy.ndarray
+        black-white image
+
+    """
+    # Gaussian blur is applied
+    w_gray_image = cv.GaussianBlur(gray_image1, (odd_kernel(21, scale),) * 2, 0)
+    blur = cv.GaussianBlur(w_gray_image, (odd_kernel(31, scale),) * 2, 0)
+
+    # a bilateral Filter is applied to reduce unwanted noise  while keeping edges fairly sharp
+    blur = cv.bilateralFilter(blur, odd_kernel(15, scale), 150, 150)
+
+    # the function assigns pixels the color black under a certain threshold and white above a certain thershold
+    thresh_image = cv.adaptiveThreshold(
+        blur, 255, cv.ADAPTIVE_THRESH_GAUSSIAN_C, cv.THRESH_BINARY, odd_kernel(101, scale), 2)
+
+    # the black-white image is filtered again
+    thresh_image = cv.medianBlur(thresh_image, odd_kernel(9, scale))
+
+    return thresh_image
+
+
+def find_circles(thresh_image, param1, param2, minsize, maxsize, scale=1):
+    """
+    detects the droplets in the preprocessed image
+
+    Parameters
+    ----------
+    thresh_image : numpy.ndarray
+        black-white image from preprocess_gray
+    param1 : float
+        defines the sensitivity of the contour detection function.
+    param2 : float
+        defines the sensitivity of the contour detection function.
+    minsize : float
+        minimum size of the detected droplets
+    maxsize : float
+        maximum size of the detected droplets.
+    scale : int, optional
+        the black-white image is downscaled by this factor, the contours are scaled to the full image.
+        The default is 1.
+
+    Returns
+    -------
+    contours : numpy.ndarray
+        x and y coordinates and the radius of the detected droplets
+
+    """
+    # the contour detection function returns the x,y coordinates and radius of the droplets, the parameters 1 and 2 define the sensitivity
+    with Timing_VODCA_eng.stage('hough'):
+        contours = cv.HoughCircles(
+            thresh_image, cv.HOUGH_GRADIENT, 1, 110 / scale, param1=param1, param2=param2,
+            minRadius=int(minsize / scale), maxRadius=int(np.ceil(maxsize / scale)))
+
+    if contours is not None:
+        contours = np.around(np.uint16(contours * scale))
+    return contours
+
+
+def refine_circles(gray_image1, contours, scale, n_rays=64):
+    """
+    refines the droplets found in the downscaled image in small windows of the full image: along rays from the
+    coarse centre the edge of the droplet is searched within the uncertainty of the downscaled image and a circle
+    is fitted to the edge points
+
+    Parameters
+    ----------
+    gray_image1 : numpy.ndarray
+        enhanced gray image in full size
+    contours : numpy.ndarray
+        contours found by find_circles in the downscaled image, in pt of the full image
+    scale : int
+        factor the image was downscaled with
+    n_rays : int, optional
+        number of rays per droplet. The default is 64.
+
+    Returns
+    -------
+    contours : numpy.ndarray
+        refined contours, droplets whose fit moves further than the uncertainty keep the coarse contour
+
+    """
+    if contours is None:
+        return None
+
+    with Timing_VODCA_eng.stage('refine'):
+        height, width = gray_image1.shape
+        coarse = contours[0].astype(float)
+        x, y, r = coarse[:, 0:1, np.newaxis], coarse[:, 1:2, np.newaxis], coarse[:, 2:3, np.newaxis]
+
+        # the edge lies within 2*scale pixels of the coarse circle
+        angles = np.linspace(0, 2 * np.pi, n_rays, endpoint=False)[np.newaxis, :, np.newaxis]
+        steps = np.arange(-2 * scale - 1, 2 * scale + 2)[np.newaxis, np.newaxis, :]
+        radii = np.maximum(r + steps, 1)
+        xx = np.clip(np.rint(x + np.cos(angles) * radii), 0, width - 1).astype(int)
+        yy = np.clip(np.rint(y + np.sin(angles) * radii), 0, height - 1).astype(int)
+
+        # the edge is the strongest change of the brightness along the ray
+        blurred = cv.GaussianBlur(gray_image1, (5, 5), 0).astype(np.float32)
+        gradient = np.abs(np.diff(blurred[yy, xx], axis=2))
+        edge = np.take_along_axis(radii, np.argmax(gradient, axis=2)[..., np.newaxis], axis=2)[..., 0] + 0.5
+        edge_x = x[..., 0] + np.cos(angles[..., 0]) * edge
+        edge_y = y[..., 0] + np.sin(angles[..., 0]) * edge
+
+        refined = contours.copy()
+        for i in range(len(coarse)):
+            fit = fit_circle(edge_x[i], edge_y[i])
+            if fit is None:
+                continue
+            # edge points of other droplets or of dirt are removed and the circle is fitted again
+            distances = np.abs(np.hypot(edge_x[i] - fit[0], edge_y[i] - fit[1]) - fit[2])
+            fit = fit_circle(edge_x[i][distances < 3], edge_y[i][distances < 3])
+            if fit is None:
+                continue
+            moved = np.hypot(fit[0] - coarse[i, 0], fit[1] - coarse[i, 1])
+            if moved <= 2 * scale and abs(fit[2] - coarse[i, 2]) <= 2 * scale:
+                refined[0, i, :3] = np.around(fit)
+    return refined
+
+
+def fit_circle(x, y):
+    """
+    least squares fit of a circle to points
+
+    Returns
+    -------
+    circle : tuple or None
+        x and y coordinates of the centre and radius, None if there are not enough points
+
+    """
+    if len(x) < 8:
+        return None
+    matrix = np.column_stack([2 * x, 2 * y, np.ones(len(x))])
+    (a, b, c), *_ = np.linalg.lstsq(matrix, x ** 2 + y ** 2, rcond=None)
+    return a, b, np.sqrt(c + a ** 2 + b ** 2)
+
+
+def draw_contours(image_1, contours):
+    """
+    draws the contours in a copy of the image
+
+    Returns
+    -------
+    image : numpy.ndarray
+        RGB image with the detected droplets drawn in
+
+    """
+    image_1 = image_1.copy()
+    if contours is not None:
+        for pt in contours[0, :]:
+            x, y, r = pt[0], pt[1], pt[2]
+            if (x + r < 1648 or y + r < 1445):
+                cv.circle(image_1, (x, y), r + 30, (0, 0, 0), 13)
+
+    return cv.cvtColor(image_1, cv.COLOR_BGR2RGB)
+
+
+def recognize_contour(image_path, param1, param2, minsize, maxsize, scale=1):
+    """
+    evaluate the contours, with scale > 1 the droplets are detected in the downscaled image and refined
+    in the full image
+
+    Parameters
+    ----------
+    image_path : str
+        path to the image, it must not contain the degree sign
+    param1 : float
+        defines the sensitivity of the contour detection function.
+    param2 : float
+        defines the sensitivity of the contour detection function.
+    minsize : float
+        minimum size of the detected droplets
+    maxsize : float
+        maximum size of the detected droplets.
+    scale : int, optional
+        factor the image is downscaled with for the detection. The default is 1.
+
+    Returns
+    -------
+    image : numpy.ndarray
+        RGB image with the detected droplets drawn in
+    contours : numpy.ndarray
+        x and y coordinates and the radius of the detected droplets
+
+    """
+    with Timing_VODCA_eng.stage('preprocess'):
+        image_1, gray_image1 = enhance_image(image_path)
+        thresh_image = preprocess_gray(gray_image1, scale)
+    contours = find_circles(thresh_image, param1, param2, minsize, maxsize, scale)
+    if scale > 1:
+        contours = refine_circles(gray_image1, contours, scale)
+    return draw_contours(image_1, contours), contours
+
+
+def parameter_files(folder_directory, filename):
+    """
+    paths of the parameter file of the subfolder and of the global parameter file of the main folder
+    """
+    return (os.path.join(folder_directory, filename, 'detection_parameters.json'),
+            os.path.join(folder_directory, 'detection_parameters.json'))
+
+
+def load_parameters(folder_directory, filename, required=False):
+    """
+    loads the parameters of the contour detection, the parameter file of the subfolder is preferred to the global one
+
+    Parameters
+    ----------
+    folder_directory : str
+        path to the main folder
+    filename : str
+        name of the subfolder
+    required : bool, optional
+        raise a FileNotFoundError if there is no parameter file instead of using DEFAULT_PARAMETERS,
+        so unattended runs do not detect the droplets with untuned parameters. The default is False.
+
+    Returns
+    -------
+    parameters : dict
+        param1, param2, minsize and maxsize (in pt), missing values are taken from DEFAULT_PARAMETERS
+
+    """
+    parameters = dict(DEFAULT_PARAMETERS)
+    for path in parameter_files(folder_directory, filename):
+        if os.path.exists(path):
+            with open(path) as file:
+                saved = json.load(file)
+            parameters.update({key: saved[key] for key in DEFAULT_PARAMETERS if key in saved})
+            return parameters
+    if required:
+        raise FileNotFoundError(f'no detection_parameters.json in {os.path.join(folder_directory, filename)} or '
+                                f'{folder_directory}, detect the droplets interactively once or write the file')
+    return parameters
+
+
+def save_parameters(folder_directory, filename, parameters):
+    """
+    saves the parameters of the contour detection in the parameter file of the subfolder
+    """
+    path = parameter_files(folder_directory, filename)[0]
+    with open(path, 'w') as file:
+        json.dump({key: parameters[key] for key in DEFAULT_PARAMETERS}, file, indent=4)
 
 
 class InteractiveContourDetection:
    
     
-    def __init__(self, image_path, filename, folder_directory):
+    def __init__(self, image_path, filename, folder_directory, scale=1):
         self.image_path = image_path
         self.filename = filename
         self.folder_directory = folder_directory
@@ -18,6 +345,16 @@ class InteractiveContourDetection:
         self.ax_image = None
         self.current_contours = None
         self.window_closed = False
+        self.parameters = dict(DEFAULT_PARAMETERS, scale=scale)
+
+        # the preprocessed image does not depend on the sliders, so it is only computed once.
+        # With scale > 1 the sliders work on the downscaled image and the contours are refined when the window closes
+        self.scale = scale
+        self.image_1 = None
+        self.gray_image1 = None
+        self.thresh_image = None
+        self.timer = None
+        self.update_pending = False
 
 
 
@@ -43,75 +380,61 @@ class InteractiveContourDetection:
             x and y coordinates and the radius of the detected droplets
 
         """
-        # for the contour detection function to work, we have to enhance the contrast and reduce noise
-        # PIL Image.open can not work with str containing '', so if the image path contains that sign it is replaced
-        self.image_path = self.rename_first_image()
-        image_1 = cv.imread(self.image_path)
-        image_to_be_enhanced = Image.open(self.image_path)
-
-        # blurs the image and enhances the contrast
-        image_to_be_enhanced = image_to_be_enhanced.filter(ImageFilter.BLUR)
-        enhancer = ImageEnhance.Contrast(image_to_be_enhanced)
-        enhanced_image = enhancer.enhance(2)
-
-        # cv2 and PIL use different data types, so now the PIL image is transformed
-        gray_image1 = cv.cvtColor(np.array(enhanced_image), cv.COLOR_RGB2GRAY)
-
-        # Gaussian blur is applied
-        w_gray_image = cv.GaussianBlur(gray_image1, (21, 21), 0)
-        blur = cv.GaussianBlur(w_gray_image, (31, 31), 0)
-
-        # a bilateral Filter is applied to reduce unwanted noise  while keeping edges fairly sharp
-        blur = cv.bilateralFilter(blur, 15, 150, 150)
-
-        # the function assigns pixels the color black under a certain threshold and white above a certain thershold
-        thresh_image = cv.adaptiveThreshold(
-            blur, 255, cv.ADAPTIVE_THRESH_GAUSSIAN_C, cv.THRESH_BINARY, 101, 2)
-
-        # the black-white image is filtered again
-        thresh_image = cv.medianBlur(thresh_image, 9)
-
-        # the contour detection function returns the x,y coordinates and radius of the droplets, the parameters 1 and 2 define the sensitivity
-        contours = cv.HoughCircles(
-            thresh_image, cv.HOUGH_GRADIENT, 1, 110, param1=param1, param2=param2, minRadius=minsize, maxRadius=maxsize)
-
-        # The contours are drawn in the image
-        if contours is not None:
-            contours = np.around(np.uint16(contours))
-            for pt in contours[0, :]:
-                x, y, r = pt[0], pt[1], pt[2]
-                if (x + r < 1648 or y + r < 1445):
-                    cv.circle(image_1, (x, y), r + 30, (0, 0, 0), 13)
+        if self.thresh_image is None:
+            # PIL Image.open can not work with str containing '', so if the image path contains that sign it is replaced
+            self.image_path = self.rename_first_image()
+            self.image_1, self.gray_image1 = enhance_image(self.image_path)
+            self.thresh_image = preprocess_gray(self.gray_image1, self.scale)
 
-        return cv.cvtColor(image_1, cv.COLOR_BGR2RGB), contours
+        self.parameters = {'param1': param1, 'param2': param2, 'minsize': minsize, 'maxsize': maxsize,
+                           'scale': self.scale}
+        contours = find_circles(self.thresh_image, param1, param2, minsize, maxsize, self.scale)
+        return draw_contours(self.image_1, contours), contours
 
     def rename_first_image(self):
-        unwanted_str = self.image_path
-        newstr = unwanted_str.replace('\u00B0', "")
-        os.rename(self.image_path, newstr)
-        self.image_path = newstr
+        self.image_path = rename_image(self.image_path)
         return self.image_path
 
     def update(self, val):
         """
-        passes the updated values of the sliders to the contour detection function
-
+        restarts the timer of the contour detection, so the contours are only detected again
+        when the slider rests for DEBOUNCE_INTERVAL ms and not for every step while it is dragged
 
         """
+        self.update_pending = True
+        self.timer.stop()
+        self.timer.start()
+
+    def slider_parameters(self):
         # links the sliders with the variables
         param1 = self.sliders['param1'].val
         param2 = self.sliders['param2'].val
         minsize = self.mu_to_pt(self.sliders['minsize'].val)
         maxsize = self.mu_to_pt(self.sliders['maxsize'].val)
+        return param1, param2, minsize, maxsize
+
+    def apply_update(self):
+        """
+        passes the updated values of the sliders to the contour detection function
+
+
+        """
+        if not self.update_pending:
+            return
+        self.update_pending = False
 
         # executes the contour detection function with the new variables
-        updated_image, contours = self.recognize_contour(
-            param1, param2, minsize, maxsize)
+        updated_image, contours = self.recognize_contour(*self.slider_parameters())
         self.current_contours = contours
         self.ax_image.set_data(updated_image)
         self.fig.canvas.draw_idle()
 
     def on_close(self, event):
+        # a slider change which was not evaluated yet is applied before the window is closed
+        if self.update_pending:
+            self.update_pending = False
+            updated_image, self.current_contours = self.recognize_contour(*self.slider_parameters())
+        self.timer.stop()
         self.window_closed = True
 
     def pt_to_mu(self, pt):
@@ -133,7 +456,8 @@ class InteractiveContourDetection:
         self.fig.subplots_adjust(left=0.1, bottom=0.3)
 
         # the contour detection function is called with some initial values
-        result_image, contours = self.recognize_contour(12, 25, 49, 140)
+        result_image, contours = self.recognize_contour(
+            *[DEFAULT_PARAMETERS[key] for key in ('param1', 'param2', 'minsize', 'maxsize')])
         self.current_contours = contours
 
         # the image and the detected circles are displayed
@@ -164,6 +488,11 @@ class InteractiveContourDetection:
             # saves current sliders
             self.sliders[key] = slider
 
+        # the contour detection is only executed when the sliders rest for a moment
+        self.timer = self.fig.canvas.new_timer(interval=DEBOUNCE_INTERVAL)
+        self.timer.single_shot = True
+        self.timer.add_callback(self.apply_update)
+
         # when the interactive plot is closed, the self.on_close function is called
         self.fig.canvas.mpl_connect('close_event', self.on_close)
 
@@ -174,4 +503,6 @@ class InteractiveContourDetection:
         while not self.window_closed:
             plt.pause(0.1)
 
+        if self.scale > 1:
+            self.current_contours = refine_circles(self.gray_image1, self.current_contours, self.scale)
         return self.current_contours
@@ -0,0 +1,132 @@
+import os
+import numpy as np
+import cv2 as cv
+import Droplets_VODCA_eng
+
+
+def droplet_grid(n_droplets, shape, rng, radius_mean=60, radius_std=8):
+    """
+    places the droplets on a jittered grid, so they do not touch each other
+
+    Parameters
+    ----------
+    n_droplets : int
+        number of droplets
+    shape : tuple
+        height and width of the images
+    rng : numpy Generator
+        random number generator
+    radius_mean : float, optional
+        mean radius in pt. The default is 60.
+    radius_std : float, optional
+        standard deviation of the radius in pt. The default is 8.
+
+    Returns
+    -------
+    contours : numpy array
+        x, y coordinates and radius of the droplets
+
+    """
+    height, width = shape
+    columns = int(np.ceil(np.sqrt(n_droplets * width / height)))
+    rows = int(np.ceil(n_droplets / columns))
+    spacing = min(width / columns, height / rows)
+
+    # the droplets keep a distance of at least 20 pt, the radius is not smaller than the minimum radius of the detection
+    radius_max = max(spacing / 2 - 10, 50)
+    radii = np.clip(rng.normal(radius_mean, radius_std, n_droplets), 50, radius_max)
+    jitter = np.clip(spacing / 2 - radii - 10, 0, None)[:, np.newaxis]
+
+    cells = np.arange(n_droplets)
+    centres = np.stack([(cells % columns + 0.5) * spacing, (cells // columns + 0.5) * spacing], axis=1)
+    centres += rng.uniform(-1, 1, (n_droplets, 2)) * jitter
+    return np.column_stack([np.round(centres), np.round(radii)]).astype(int)
+
+
+def image_name(index, temperature, prefix='image'):
+    # the temperature is written like the camera does: -12,5 for -12.5
+    return f'{prefix}_{index:04d}_{-temperature:.1f}'.replace('.', ',') + '.jpg'
+
+
+def synthetic_series(directory, n_droplets=100, n_frames=50, start_temperature=5.0, step=0.5, shape=(1536, 2048),
+                     radius_mean=60, radius_std=8, noise=3, drift=0.0, label=True, frozen_fraction=0.9, contrast=60,
+                     seed=0):
+    """
+    renders a series of images of a droplet array which freezes while the temperature decreases
+
+    the liquid droplets are bright and the frozen droplets dark, like in the experiment. The names of the images
+    contain the temperature in the format cut_out_temperature expects.
+
+    Parameters
+    ----------
+    directory : str
+        the images are written to this folder
+    n_droplets : int, optional
+        number of droplets. The default is 100.
+    n_frames : int, optional
+        number of images. The default is 50.
+    start_temperature : float, optional
+        temperature (absolute value, in degree Celsius below zero) of the first image. The default is 5.0.
+    step : float, optional
+        temperature difference between two images. The default is 0.5.
+    shape : tuple, optional
+        height and width of the images. The default is (1536, 2048).
+    radius_mean : float, optional
+        mean radius of the droplets in pt. The default is 60.
+    radius_std : float, optional
+        standard deviation of the radius in pt. The default is 8.
+    noise : float, optional
+        amplitude of the noise added to every pixel in gray values. The default is 3.
+    drift : float, optional
+        change of the brightness of the whole image from one image to the next in gray values, negative values
+        darken the images. The default is 0.0.
+    label : bool, optional
+        draws the labelling with the temperature in the right corner. The default is True.
+    frozen_fraction : float, optional
+        fraction of the droplets which freeze during the series. The default is 0.9.
+    contrast : int, optional
+        the droplets get darker by this gray value when they freeze. The default is 60.
+    seed : int, optional
+        seed of the random number generator. The default is 0.
+
+    Returns
+    -------
+    truth : dict
+        images, temperatures, contours (x, y, radius), freeze_temperatures (nan for droplets which do not freeze)
+        and evaluated (droplets which are not excluded by the analysis)
+
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+
+    contours = droplet_grid(n_droplets, shape, rng, radius_mean, radius_std)
+    temperatures = start_temperature + step * np.arange(n_frames)
+
+    # index of the first image on which the droplet is frozen, droplets which do not freeze get n_frames
+    freeze_frames = rng.integers(1, n_frames, n_droplets)
+    freeze_frames[rng.random(n_droplets) >= frozen_fraction] = n_frames
+    freeze_temperatures = np.where(freeze_frames < n_frames, temperatures[np.minimum(freeze_frames, n_frames - 1)],
+                                   np.nan)
+
+    images = []
+    for k, temperature in enumerate(temperatures):
+        image = np.full(shape + (3,), 200, dtype=np.uint8)
+        for (x, y, r), frozen in zip(contours, freeze_frames <= k):
+            colour = (150 - contrast,) * 3 if frozen else (150, 150, 150)
+            cv.circle(image, (int(x), int(y)), int(r), colour, -1)
+
+        # lighting drift and camera noise
+        image = image + np.int16(round(drift * k)) + rng.integers(-noise, noise + 1, image.shape, dtype=np.int16)
+        image = np.clip(image, 0, 255).astype(np.uint8)
+
+        if label:
+            cv.rectangle(image, (1660, 1460), (shape[1], shape[0]), (30, 30, 30), -1)
+            cv.putText(image, f'{-temperature:.1f} C', (1680, 1510), cv.FONT_HERSHEY_SIMPLEX, 1.2, (255, 255, 255), 2)
+
+        path = os.path.join(directory, image_name(k, temperature))
+        cv.imwrite(path, image)
+        images.append(path)
+
+    return {'images': images, 'temperatures': temperatures, 'contours': contours,
+            'freeze_temperatures': freeze_temperatures,
+            'evaluated': ~Droplets_VODCA_eng.excluded_droplets(contours)}
@@ -0,0 +1,134 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+
+
+class Timer:
+    """
+    sums up the time spent in the stages of the analysis and counts frames, droplets and bytes
+    """
+
+    def __init__(self):
+        self.enabled = True
+        self.seconds = {}
+        self.calls = {}
+        self.counters = {}
+        self.started = time.perf_counter()
+        # the frames are decoded on several threads when they are prefetched
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            with self.lock:
+                self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+                self.calls[name] = self.calls.get(name, 0) + 1
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def report(self):
+        """
+        run time of every stage, the counters and derived rates as a dict
+        """
+        wall_time = time.perf_counter() - self.started
+        frames = self.counters.get('frames', 0)
+        report = {'wall_time_s': wall_time,
+                  'stages': {name: {'seconds': self.seconds[name], 'calls': self.calls[name]} for name in self.seconds},
+                  'counters': dict(self.counters)}
+        if frames:
+            report['frames_per_s'] = frames / wall_time
+            report['droplets_per_frame'] = self.counters.get('droplets_examined', 0) / frames
+        return report
+
+
+class NullTimer:
+    """
+    timer which does nothing, it is used when the instrumentation is switched off
+    """
+    enabled = False
+
+    def stage(self, name):
+        return nullcontext()
+
+    def count(self, name, n=1):
+        pass
+
+
+# the timer of the running analysis, every process has its own
+current = NullTimer()
+
+
+def stage(name):
+    """
+    context manager which adds the time of the enclosed code to the stage name
+    """
+    return current.stage(name)
+
+
+def count(name, n=1):
+    current.count(name, n)
+
+
+def enabled():
+    return current.enabled
+
+
+def start():
+    """
+    switches the instrumentation on, the counters start at 0
+    """
+    global current
+    current = Timer()
+    return current
+
+
+def timing_path(folder_directory, filename):
+    return os.path.join(folder_directory, f'timing_{filename}.json')
+
+
+def stop(folder_directory=None, filename=None):
+    """
+    switches the instrumentation off and saves the report of the subfolder in timing_<name>.json
+
+    Parameters
+    ----------
+    folder_directory : str, optional
+        path to the main folder, None does not save the report. The default is None.
+    filename : str, optional
+        name of the subfolder. The default is None.
+
+    Returns
+    -------
+    report : dict or None
+        see Timer.report, None if the instrumentation was switched off
+
+    """
+    global current
+    timer, current = current, NullTimer()
+    if not timer.enabled:
+        return None
+
+    report = timer.report()
+    if folder_directory is not None:
+        report['folder'] = filename
+        with open(timing_path(folder_directory, filename), 'w') as file:
+            json.dump(report, file, indent=4)
+    return report
+
+
+def print_progress(i, n_images, temperature):
+    """
+    prints a progress line which is overwritten by the next one
+    """
+    rate = ''
+    if current.enabled and current.counters.get('frames'):
+        rate = f', {current.counters["frames"] / (time.perf_counter() - current.started):.1f} frames/s'
+    print(f'\rimage {i}/{n_images}, temperature {temperature}{rate}', end='' if i < n_images else '\n', flush=True)
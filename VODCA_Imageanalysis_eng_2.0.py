@@ -6,17 +6,31 @@ Created on Sun May  4 21:24:14 2025
 """
 
 import os
+import functools
 import numpy as np
 import csv
 import re
 import cv2 as cv
-from PIL import Image
-import Slider_VODCA_eng
-import Auswertung_VODCA_eng
-import glob
-
-
-def work_through_folder(folder_directory, data_evaluation='yes', **kwargs):
+import Frames_VODCA_eng
+import Droplets_VODCA_eng
+import Batch_VODCA_eng
+import Cache_VODCA_eng
+import Results_VODCA_eng
+import Patches_VODCA_eng
+import Timing_VODCA_eng
+import Changes_VODCA_eng
+import time
+
+
+# answers of the non-interactive mode when lots of droplets freeze at once
+POLICIES = {'continue': 'go on', 'skip': 'skip', 'abort': 'exit'}
+
+
+def work_through_folder(folder_directory, data_evaluation='yes', prefetch=0, workers=1, headless=False, policy=None,
+                        redetect=False, checkpoint_every=50, resume=False, output='csv', store_ratios=False,
+                        extract=False, timing=False, progress=False, grayscale=False, reduce=1, detect_changes=False,
+                        skip_quiescent=False, sensitivity=0.2,
+                        **kwargs):
     """
     unpacks all subfolders of the given directory
     Parameters
@@ -25,6 +39,62 @@ def work_through_folder(folder_directory, data_evaluation='yes', **kwargs):
         path to the folder
     data_evaluation : str, optional
         should the data be evaluated? The default is 'yes'.
+    prefetch : int, optional
+        number of images which are decoded in advance on worker threads, 0 switches prefetching off. The default is 0.
+    workers : int, optional
+        number of subfolders which are evaluated in parallel processes, the contour detection is done for all
+        subfolders first. With more than one worker the summary of all subfolders is returned. The default is 1.
+    headless : bool, optional
+        if True the contour detection runs without the interactive window, with the parameters of
+        detection_parameters.json of the subfolder or of the main folder. The default is False.
+    policy : str, optional
+        continue/skip/abort, used instead of asking the user when lots of droplets freeze at once: continue ignores
+        the issue, skip stops the subfolder and goes on with the next one, abort stops the whole evaluation.
+        None asks the user, in headless mode the default is 'continue'. The default is None.
+    redetect : bool, optional
+        if True the droplets are detected again even if there are saved contours for the image. The default is False.
+    checkpoint_every : int, optional
+        the state of the analysis is saved in checkpoint_<name>.npz after this number of images, 0 switches
+        checkpoints off. The default is 50.
+    resume : bool or float, optional
+        True resumes every subfolder at the temperature of its checkpoint, a temperature resumes at this temperature
+        (e.g. after bad images were deleted), False starts from the beginning. A retry always resumes at the
+        checkpoint saved before the affected images if checkpoints are switched on. The default is False.
+    output : str, optional
+        'csv' writes droplets_<name>.csv, 'npz' writes typed arrays (radius, position and freezing temperature
+        of every droplet) to droplets_<name>.npz, 'both' writes both files. The default is 'csv'.
+    store_ratios : bool, optional
+        if True the sum of differences/ Area of every droplet and pair of frames is saved in ratios_<name>.npy,
+        so the freezing can be classified with another threshold by Droplets_VODCA_eng.reclassify. The default is False.
+    extract : bool, optional
+        if True the pixels of all droplets of all images are saved in patches_<name>.npy after the contour
+        detection (gray pixels at 1/reduce of their size in the grayscale mode), Patches_VODCA_eng.reanalyse
+        evaluates them like the analysis without decoding the images again. The default is False.
+    timing : bool, optional
+        if True the time of every stage (decoding, contour detection, counting, writing) and the number of frames,
+        droplets and bytes read are measured and saved in timing_<name>.json. The default is False.
+    progress : bool, optional
+        prints a progress line for every image. The default is False.
+    grayscale : bool, optional
+        low-memory mode: the images are decoded directly to gray images and the larger of the sums of darkening and
+        brightening is taken, so droplets which get brighter are detected as well. The default is False.
+    reduce : int, optional
+        in the grayscale mode the images are decoded at 1/reduce of their size (2, 4 or 8 for JPEG images).
+        The default is 1.
+    detect_changes : bool, optional
+        if True every pair of images is checked for a moved sample and changed lighting before the droplets are
+        evaluated: the first image is moved and brightened to match the second one, the droplets are moved with
+        the sample and the events are saved in events_<name>.csv. Lots of droplets freezing at once are only
+        saved as an event instead of asking the user, unless the sample moved or the lighting changed at the same
+        pair of images. The default is False.
+    skip_quiescent : bool, optional
+        if True a coarse score on downsampled images finds the droplets which changed, only these droplets are
+        evaluated and pairs of images without changed droplets are skipped. It assumes that freezing droplets change
+        their mean brightness, so it can change the results, see Changes_VODCA_eng.QuiescenceFilter. The number of
+        skipped pairs is printed and saved in the timing report. The default is False.
+    sensitivity : float, optional
+        droplets are evaluated if their coarse score exceeds this fraction of the threshold, smaller values skip
+        less. The default is 0.2.
     **kwargs : TYPE
         optional arguments for Nm calculation (a,b,d)
 
@@ -37,44 +107,87 @@ def work_through_folder(folder_directory, data_evaluation='yes', **kwargs):
     folders = [f for f in os.listdir(folder_directory) if os.path.isdir(
         os.path.join(folder_directory, f))]
 
+    if headless and policy is None:
+        policy = 'continue'
+
+    if workers > 1:
+        return Batch_VODCA_eng.work_through_folders_parallel(
+            folder_directory, folders, workers, prefetch=prefetch, policy=policy or 'continue', headless=headless,
+            redetect=redetect, checkpoint_every=checkpoint_every, resume=resume, output=output,
+            store_ratios=store_ratios, extract=extract, timing=timing, progress=progress, grayscale=grayscale,
+            reduce=reduce, detect_changes=detect_changes, skip_quiescent=skip_quiescent, sensitivity=sensitivity)
+
     for folder in folders:
+        resume_folder = resume
         while True:  
             directory = os.path.join(folder_directory,folder)
             filename = os.path.basename(directory)
             print(f'currently folder {filename} is being evaluted')
+            if timing:
+                Timing_VODCA_eng.start()
             
-            # creates a list with all the images in the directory
-            all_images = glob.glob(os.path.join(directory, "*.jpg"))
-            
-            # calls the contourdetection function
-            contours = recognize_contour(all_images[1], filename, folder_directory)
-            print('contour detection finished, droplets are being counted...')
-            contours = contours.tolist()
-            
-            #contour detection function is able to change the image path of image 1 so we have to extract it again
-            all_images = glob.glob(os.path.join(directory, "*.jpg"))
-            # creates a mask for the droplets, to be able to skip already as frozen detected droplets in further analysis
-            contours_boolean = [[1] for i in contours]
-            contours_YN = np.append(contours, contours_boolean, axis=1)
-
-            prepare_csv(folder_directory, filename)
+            # creates a list with all the images in the directory, sorted by temperature
+            index = Frames_VODCA_eng.build_frame_index(folder_directory, filename)
+            Frames_VODCA_eng.report_frame_index(index)
+            all_images = index['images']
+
+            # the checkpoint contains the contours and the frozen droplets up to the temperature the analysis resumes at
+            state = None
+            if resume_folder is not False:
+                state = Cache_VODCA_eng.load_checkpoint(
+                    folder_directory, filename, None if resume_folder is True else resume_folder)
+
+            if state is not None:
+                print(f'analysis resumes at {state["temperature"]}')
+                contours_YN = state['contours_YN']
+                rows = state['rows'].tolist()
+            else:
+                # calls the contourdetection function or loads the saved contours
+                contours = detect_droplets(all_images[1], filename, folder_directory, headless=headless, redetect=redetect)
+                print('contour detection finished, droplets are being counted...')
+                contours = contours.tolist()
+
+                #contour detection function is able to change the image path of image 1 so we have to extract it again
+                index = Frames_VODCA_eng.build_frame_index(folder_directory, filename)
+                all_images = index['images']
+                # creates a mask for the droplets, to be able to skip already as frozen detected droplets in further analysis,
+                # droplets which are too small or lie in the labelling of the picture are switched off right away
+                contours_YN = np.append(contours, Droplets_VODCA_eng.droplet_mask(contours), axis=1)
+                rows = []
+
+                if extract:
+                    Patches_VODCA_eng.extract_patches(all_images, index['temperatures'], folder_directory, filename,
+                                                      contours, prefetch=prefetch,
+                                                      grayscale=grayscale, reduce=reduce)
+
+            prepare_csv(folder_directory, filename, rows, output=output)
             array_ratio = []
             array_radius = []
     
-            status, contours_YN, ratio, array_radius = main(all_images, filename, folder_directory, contours_YN, array_ratio, array_radius)
+            status, contours_YN, ratio, array_radius = main(all_images, filename, folder_directory, contours_YN, array_ratio, array_radius, prefetch=prefetch, policy=policy,
+                                                            checkpoint_every=checkpoint_every, resume=state, output=output,
+                                                            store_ratios=store_ratios, temperatures=index['temperatures'],
+                                                            progress=progress, grayscale=grayscale, reduce=reduce,
+                                                            detect_changes=detect_changes,
+                                                            skip_quiescent=skip_quiescent, sensitivity=sensitivity)
+            if timing:
+                Timing_VODCA_eng.stop(folder_directory, filename)
             
             if status == 'exit':
                 
                 return  
             elif status == 'retry':
-                
+                if checkpoint_every:
+                    resume_folder = True
                 continue  
-            elif status == 'go on':
+            elif status in ('go on', 'skip', 'error'):
                 
                 break 
     
 
-def main(all_images, filename, folder_directory, contours_YN, array_ratio, array_radius):
+def main(all_images, filename, folder_directory, contours_YN, array_ratio, array_radius, prefetch=0, policy=None,
+         checkpoint_every=50, resume=None, output='csv', store_ratios=False, temperatures=None, progress=False,
+         grayscale=False, reduce=1, detect_changes=False, skip_quiescent=False, sensitivity=0.2):
     """
     this is the main function, calling all the important functions
 
@@ -84,37 +197,198 @@ def main(all_images, filename, folder_directory, contours_YN, array_ratio, array
         path to the subfolder.
     folder_directory : str
         path to the main folder
+    prefetch : int, optional
+        number of images which are decoded in advance on worker threads, 0 switches prefetching off. The default is 0.
+    policy : str, optional
+        answer (continue/skip/abort or go on/exit/retry) which is used instead of asking the user when lots of
+        droplets freeze at once, None asks the user. The default is None.
+    checkpoint_every : int, optional
+        the state of the analysis is saved after this number of images, 0 switches checkpoints off. The default is 50.
+    resume : dict, optional
+        state loaded with Cache_VODCA_eng.load_checkpoint, images up to its temperature are skipped. The default is None.
+    output : str, optional
+        'csv', 'npz' or 'both', see Results_VODCA_eng.ResultWriter. The default is 'csv'.
+    store_ratios : bool, optional
+        saves the ratios of all droplets and pairs of frames in a Droplets_VODCA_eng.RatioStore. The default is False.
+    temperatures : list, optional
+        temperature of every image, e.g. from Frames_VODCA_eng.build_frame_index, None parses the names of the
+        images. The default is None.
+    progress : bool, optional
+        prints a progress line for every image. The default is False.
+    grayscale : bool, optional
+        decode gray images and detect droplets which get brighter as well. The default is False.
+    reduce : int, optional
+        decode the gray images at 1/reduce of their size. The default is 1.
+    detect_changes : bool, optional
+        check every pair of images for a moved sample and changed lighting with a Changes_VODCA_eng.ChangeDetector
+        and correct them, see work_through_folder. The default is False.
+    skip_quiescent : bool, optional
+        only the droplets which changed according to a Changes_VODCA_eng.QuiescenceFilter are evaluated, pairs of
+        images without changed droplets are skipped. It is switched off if the ratios are stored. The default is False.
+    sensitivity : float, optional
+        droplets are evaluated if their coarse score exceeds this fraction of the threshold. The default is 0.2.
 
     Returns
     -------
     None.
 
     """
+    # every image is decoded only once, the previous frame is kept in the cache of the frame source
+    decoder = Frames_VODCA_eng.load_image
+    if grayscale:
+        decoder = functools.partial(Frames_VODCA_eng.load_gray, reduce=reduce)
+    if prefetch > 0:
+        frames = Frames_VODCA_eng.PrefetchFrameSource(all_images, n_prefetch=prefetch, decoder=decoder)
+    else:
+        frames = Frames_VODCA_eng.FrameSource(all_images, decoder=decoder)
+
+    # the temperatures are extracted out of the names of the images only once
+    if temperatures is None:
+        temperatures = [float(cut_out_temperature(image)) for image in all_images]
+
+    # freezing temperature and row (step) of every droplet and the rows of the csv file, they are saved in the checkpoints
+    temperature = 0
+    if resume is not None:
+        temperature = resume['temperature']
+        freeze_temperatures = resume['freeze_temperatures'].copy()
+        freeze_steps = resume['freeze_steps'].copy()
+        rows = resume['rows'].tolist()
+    else:
+        freeze_temperatures = np.full(len(contours_YN), np.nan)
+        freeze_steps = np.full(len(contours_YN), -1)
+        rows = []
+    writer = Results_VODCA_eng.ResultWriter(folder_directory, filename, output, rows)
+    ratio_store = None
+    detector = Changes_VODCA_eng.ChangeDetector() if detect_changes else None
+    quiescence = None
+    scale = reduce if grayscale else 1
+
+    def checkpoint(contours, freezing, checkpoint_temperature):
+        if checkpoint_every:
+            writer.flush()
+            with Timing_VODCA_eng.stage('checkpoint'):
+                Cache_VODCA_eng.save_checkpoint(folder_directory, filename, contours, freezing,
+                                                checkpoint_temperature, writer.rows, freeze_steps)
+
+    def build_label_map(contours):
+        label_map = Droplets_VODCA_eng.DropletLabelMap(contours, frames.get(0).shape, absolute=grayscale,
+                                                       reduce=scale)
+        if ratio_store is None:
+            # only the liquid droplets are read, the ratio store needs the ratios of all droplets
+            label_map.compact(np.asarray(contours)[:, 3] == 1)
+        return label_map
+
+    def build_quiescence_filter(contours):
+        # the ratio store needs the ratios of all droplets, so no droplet is skipped
+        if not skip_quiescent or ratio_store is not None:
+            return None
+        quiescence_filter = Changes_VODCA_eng.QuiescenceFilter(contours, frames.get(0).shape, sensitivity=sensitivity,
+                                                               reduce=scale)
+        # the filter is built again when the sample moved, the counters go on
+        if quiescence is not None:
+            quiescence_filter.pairs = quiescence.pairs
+            quiescence_filter.pairs_skipped = quiescence.pairs_skipped
+            quiescence_filter.droplets_skipped = quiescence.droplets_skipped
+        return quiescence_filter
+
     try:
-        temperature = 0
+        # the label image of the droplets is built once and used for all pairs of frames
+        if store_ratios:
+            ratio_store = Droplets_VODCA_eng.RatioStore(folder_directory, filename, len(contours_YN),
+                                                        len(all_images) - 1, resume=resume is not None)
+        label_map = build_label_map(contours_YN)
+        quiescence = build_quiescence_filter(contours_YN)
+
+        n_images = 0
         for i in range(len(all_images) - 1):
 
-            # the temperature is extracted out of the name of the image
-            if (float(cut_out_temperature(all_images[i + 1]))-temperature) < 0:
+            # images which were evaluated before the checkpoint are skipped
+            if resume is not None and temperatures[i + 1] <= resume['temperature']:
+                continue
+
+            # images which are not sorted by temperature end the analysis
+            if (temperatures[i + 1]-temperature) < 0:
+                print(f'the temperature decreases at {all_images[i + 1]}, the following images are not evaluated')
                 break
-            temperature = float(cut_out_temperature(all_images[i + 1]))
+            previous_temperature = temperature
+            previous_contours_YN = np.array(contours_YN, copy=True)
+            temperature = float(temperatures[i + 1])
 
             # counts frozen droplets
-            n_Tropfen, contours_YN, array_ratio, array_radius = count_frozen_droplets(
-                all_images[i], all_images[i + 1], contours_YN, temperature, array_ratio, filename, folder_directory
-            )
+            with Timing_VODCA_eng.stage('frames'):
+                image1, image2 = frames.get(i), frames.get(i + 1)
+
+            # a moved sample or changed lighting is corrected before the droplets are evaluated
+            original_image1 = image1
+            if detector is not None:
+                with Timing_VODCA_eng.stage('changes'):
+                    change = detector.check(i, image1, image2)
+                    image1 = Changes_VODCA_eng.register(image1, change)
+                if change['lighting']:
+                    print(f'the lighting changed at {temperature} by {change["brightness"]:.1f} gray values')
+                    Changes_VODCA_eng.write_event(folder_directory, filename, temperature, 'lighting', change, scale)
+                if change['moved']:
+                    # the shift is measured in the decoded frames, the contours are in pixels of the full images
+                    dx, dy = np.array(change['shift']) * scale
+                    print(f'the sample moved at {temperature} by ({dx:.1f}, {dy:.1f}) pixels, the droplets are moved too')
+                    Changes_VODCA_eng.write_event(folder_directory, filename, temperature, 'moved', change, scale)
+                    contours_YN = np.array(contours_YN, dtype=float)
+                    contours_YN[:, :2] = np.clip(contours_YN[:, :2] + np.array([dx, dy]), 0, None)
+                    previous_contours_YN = np.array(contours_YN, copy=True)
+                    label_map = build_label_map(contours_YN)
+                    quiescence = build_quiescence_filter(contours_YN)
+
+            # only the droplets which changed are evaluated
+            changed = None
+            if quiescence is not None:
+                with Timing_VODCA_eng.stage('quiescence'):
+                    changed = quiescence.changed(i, image1, image2, np.asarray(contours_YN)[:, 3] == 1,
+                                                 registered=image1 is not original_image1)
+            with Timing_VODCA_eng.stage('count'):
+                n_Tropfen, contours_YN, array_ratio, array_radius = count_frozen_droplets(
+                    image1, image2, contours_YN, temperature, array_ratio, filename, folder_directory,
+                    label_map=label_map, ratio_store=ratio_store, frame_index=i, droplets=changed
+                )
+            if Timing_VODCA_eng.enabled():
+                Timing_VODCA_eng.count('frames')
+                if changed is None:
+                    Timing_VODCA_eng.count('droplets_examined', int(np.count_nonzero(previous_contours_YN[:, 3] == 1)))
+                else:
+                    Timing_VODCA_eng.count('droplets_examined', int(np.count_nonzero(changed)))
+                    Timing_VODCA_eng.count('droplets_skipped',
+                                           int(np.count_nonzero((previous_contours_YN[:, 3] == 1) & ~changed)))
+                    Timing_VODCA_eng.count('pairs_skipped', int(not changed.any()))
+            if progress:
+                Timing_VODCA_eng.print_progress(i + 1, len(all_images) - 1, temperature)
+            newly_frozen = (previous_contours_YN[:, 3] == 1) & (np.asarray(contours_YN)[:, 3] == 0)
+            freeze_temperatures[newly_frozen] = temperature
+            if n_Tropfen > 0 and ratio_store is None:
+                label_map.compact(np.asarray(contours_YN)[:, 3] == 1)
 
             # if there are any frozen droplets at a certain temperature, their parameters are saved in a csv file
-            if n_Tropfen > 6:
+            if n_Tropfen > 6 and detector is not None and not (change['moved'] or change['lighting']):
+                # the sample did not move and the lighting did not change, so the droplets are accepted,
+                # after a correction of the same pair they may be errors of the correction and the policy decides
+                print(f'{n_Tropfen} droplets froze at {temperature}, the event is saved')
+                Changes_VODCA_eng.write_event(folder_directory, filename, temperature, 'many frozen', change, scale)
+            elif n_Tropfen > 6:
                 print('-------------------------------------------------')
                 print('attention lots of frozen droplets are detected, check if lighting conditions were changed or sample was moved')
                 print(f'current temperature: {temperature}')
                 print('suggested workflow: check if something went wrong and if necessary delete the affected images')
-                user_input = input("Do you want to continue ( ignore the issue) ? (go on/exit/retry): ")
+                if policy is None:
+                    user_input = input("Do you want to continue ( ignore the issue) ? (go on/exit/retry): ")
+                else:
+                    user_input = POLICIES.get(policy, policy)
+                    print(f'answer of the non-interactive mode: {policy}')
                 if user_input.lower() == "go on":
                     print("Continuing...")
                     print('-------------------------------------------------')
                     
+                if user_input.lower() in ('retry', 'exit', 'skip'):
+                    # the checkpoint is set before the affected images, so the analysis can resume there
+                    freeze_temperatures[newly_frozen] = np.nan
+                    checkpoint(previous_contours_YN, freeze_temperatures, previous_temperature)
                 if user_input.lower() == 'retry':
                     print("Retrying")
                     print('-------------------------------------------------')
@@ -122,29 +396,153 @@ def main(all_images, filename, folder_directory, contours_YN, array_ratio, array
                 if user_input.lower() == 'exit':
                     print("Exiting...")
                     return 'exit', contours_YN, array_ratio, array_radius
+                if user_input.lower() == 'skip':
+                    print("Skipping the rest of the folder...")
+                    print('-------------------------------------------------')
+                    return 'skip', contours_YN, array_ratio, array_radius
             
                 
             if n_Tropfen > 0:
-                write_file(str(temperature), str(n_Tropfen), str(
-                    array_radius), filename, folder_directory)
-            
+                freeze_steps[newly_frozen] = len(writer.rows)
+                writer.write_row(temperature, n_Tropfen, array_radius)
+
+            n_images += 1
+            if checkpoint_every and n_images % checkpoint_every == 0:
+                checkpoint(contours_YN, freeze_temperatures, temperature)
+
+        checkpoint(contours_YN, freeze_temperatures, temperature)
+        if quiescence is not None:
+            print(quiescence.report())
 
     except Exception as e:
         print(e)
+        return 'error', contours_YN, array_ratio, array_radius
+    finally:
+        frames.close()
+        if ratio_store is not None:
+            ratio_store.flush()
+        writer.save(contours_YN, freeze_temperatures, ~Droplets_VODCA_eng.excluded_droplets(contours_YN), freeze_steps)
     return 'go on', contours_YN, array_ratio, array_radius
 
-def prepare_csv(folder_directory, filename):
+def watch_folder(folder_directory, folder, poll_interval=2.0, idle_timeout=600, headless=False, policy='continue',
+                 prefetch=0, checkpoint_every=50, output='csv', **kwargs):
+    """
+    analyses the images of a subfolder while the camera writes them, new images are evaluated as soon as they are
+    complete, the csv file is extended and the current Nm is printed
+
+    Parameters
+    ----------
+    folder_directory : str
+        path to the main folder
+    folder : str
+        name of the subfolder the camera writes to
+    poll_interval : float, optional
+        seconds between two looks into the subfolder. The default is 2.0.
+    idle_timeout : float, optional
+        the analysis stops when there was no new image for this number of seconds. The default is 600.
+    headless : bool, optional
+        detect the droplets with the saved parameters instead of the interactive window. The default is False.
+    policy : str, optional
+        continue/skip/abort, used when lots of droplets freeze at once, None asks the user. The default is 'continue'.
+    prefetch : int, optional
+        number of images which are decoded in advance. The default is 0.
+    checkpoint_every : int, optional
+        the state of the analysis is saved after this number of images, at least 1. The default is 50.
+    output : str, optional
+        'csv', 'npz' or 'both', see Results_VODCA_eng.ResultWriter. The default is 'csv'.
+    **kwargs : TYPE
+        optional arguments for Nm calculation (a,b,d,V_method)
+
+    Returns
+    -------
+    gesamtdaten_Nm : dataframe
+        evaluation of the frozen droplets at the end of the acquisition
+
+    """
+    import Auswertung_VODCA_eng
+
+    directory = os.path.join(folder_directory, folder)
+    checkpoint_every = max(checkpoint_every, 1)
+
+    # manifest of the images and their sizes, an image is only complete if its size did not change since the last poll
+    manifest = {}
+    complete_images = []
+    contours_YN = None
+    gesamtdaten_Nm = None
+    last_new_image = time.time()
+
+    while time.time() - last_new_image < idle_timeout:
+        new_images = []
+        for entry in os.scandir(directory):
+            if not entry.name.lower().endswith('.jpg') or entry.path in complete_images:
+                continue
+            if Frames_VODCA_eng.parse_temperature(entry.name) is None:
+                continue
+            size = entry.stat().st_size
+            if size > 0 and manifest.get(entry.path) == size:
+                new_images.append(entry.path)
+            manifest[entry.path] = size
+
+        if new_images:
+            last_new_image = time.time()
+            complete_images = sorted(complete_images + new_images, key=Frames_VODCA_eng.parse_temperature)
+
+        # the droplets are detected in the second image like in work_through_folder
+        if contours_YN is None and len(complete_images) > 1:
+            contours = detect_droplets(complete_images[1], folder, folder_directory, headless=headless)
+            complete_images = [image.replace('\u00B0', "") if i == 1 else image for i, image in enumerate(complete_images)]
+            contours_YN = np.append(contours.tolist(), Droplets_VODCA_eng.droplet_mask(contours), axis=1)
+            total_number_of_droplets = int(np.count_nonzero(~Droplets_VODCA_eng.excluded_droplets(contours_YN)))
+            prepare_csv(folder_directory, folder, output=output)
+            Cache_VODCA_eng.save_checkpoint(folder_directory, folder, contours_YN,
+                                            np.full(len(contours_YN), np.nan), 0, [])
+            print(f'{total_number_of_droplets} droplets are evaluated live')
+
+        if new_images and contours_YN is not None:
+            # only the images after the temperature of the last checkpoint are evaluated
+            state = Cache_VODCA_eng.load_checkpoint(folder_directory, folder)
+            status, contours_YN, ratio, array_radius = main(
+                complete_images, folder, folder_directory, state['contours_YN'], [], [], prefetch=prefetch,
+                policy=policy, checkpoint_every=checkpoint_every, resume=state, output=output)
+            # the checkpoint lies before the skipped images, every later poll would skip them again
+            if status in ('exit', 'skip'):
+                print(f'live analysis of folder {folder} stopped ({status})')
+                break
+
+            rows = Cache_VODCA_eng.load_checkpoint(folder_directory, folder)['rows'].tolist()
+            if rows:
+                gesamtdaten_Nm = Auswertung_VODCA_eng.evaluate_rows(rows, total_number_of_droplets, **kwargs)
+                print(f'temperature: {gesamtdaten_Nm.iloc[-1, 0]}, frozen droplets: '
+                      f'{gesamtdaten_Nm.iloc[-1, 3]}/{total_number_of_droplets}, Nm: {gesamtdaten_Nm.iloc[-1, 5]}')
+
+        time.sleep(poll_interval)
+
+    else:
+        print(f'no new images for {idle_timeout} s, live analysis of folder {folder} finished')
+    return gesamtdaten_Nm
+
+
+def prepare_csv(folder_directory, filename, rows=(), output='csv'):
     file_path = os.path.join(folder_directory, f'droplets_{filename}.csv')
 
-    # deletes old evaluation files
-    if os.path.exists(file_path):
-        os.remove(file_path)
+    # deletes old evaluation files, the events are kept when an analysis is resumed
+    old_files = [file_path, Results_VODCA_eng.npz_path(folder_directory, filename)]
+    if not len(rows):
+        old_files.append(Changes_VODCA_eng.events_path(folder_directory, filename))
+    for old_file in old_files:
+        if os.path.exists(old_file):
+            os.remove(old_file)
+    if output == 'npz':
+        return
 
     # schreibt die Überschrift in die csv Datei
     with open(file_path, mode='w', newline='') as file:
         writer = csv.writer(file)
         writer.writerow(
             ['temperature', 'number of frozen droplets', 'radius frozen droplets'])
+
+        # rows of an analysis which is resumed
+        writer.writerows(rows)
     
     
     
@@ -154,16 +552,76 @@ def image_names(directory):
     return [os.path.join(directory, file) for file in os.listdir(directory)]
 
 
-def recognize_contour(image, filename, folder_directory):
+def recognize_contour(image, filename, folder_directory, headless=False):
     """
-    creates an object of the class InteractiveContourDetection
+    creates an object of the class InteractiveContourDetection, the accepted parameters are saved in the subfolder.
+    In headless mode the saved parameters are used without showing the window, a FileNotFoundError is raised
+    if there is no parameter file.
     """
+    # matplotlib is only imported when the droplets have to be detected
+    import Slider_VODCA_eng
+
+    if headless:
+        parameters = Slider_VODCA_eng.load_parameters(folder_directory, filename, required=True)
+        print(f'contour detection with {parameters}')
+        image = Slider_VODCA_eng.rename_image(image)
+        result_image, contours = Slider_VODCA_eng.recognize_contour(image, **parameters)
+        if contours is None:
+            raise ValueError(f'no droplets detected in {image} with {parameters}')
+        return contours[0, :, :]
+
+    # the scale of the pyramid mode is taken from the saved parameters, the sliders set the other parameters
     interactive = Slider_VODCA_eng.InteractiveContourDetection(
-        image, filename, folder_directory)
+        image, filename, folder_directory, scale=Slider_VODCA_eng.load_parameters(folder_directory, filename)['scale'])
     contours = interactive.show()
+    Slider_VODCA_eng.save_parameters(folder_directory, filename, interactive.parameters)
     return contours[0, :, :]
 
 
+def detect_droplets(image, filename, folder_directory, headless=False, redetect=False):
+    """
+    loads the contours saved for the image or detects them and saves them next to the csv file
+
+    Parameters
+    ----------
+    image : str
+        path to the image or a Frames_VODCA_eng.StackFrame
+    filename : str
+        name of the subfolder.
+    folder_directory : str
+        path to the main folder
+    headless : bool, optional
+        detect the droplets without the interactive window. The default is False.
+    redetect : bool, optional
+        ignore the saved contours. The default is False.
+
+    Returns
+    -------
+    contours : numpy array
+        x, y coordinates and radius of the droplets
+
+    """
+    import Slider_VODCA_eng
+
+    # a frame of a TIFF stack or video is saved as image file first
+    image = Frames_VODCA_eng.frame_file(image, folder_directory)
+
+    # in headless mode the contours have to be detected with the current parameters, in interactive mode
+    # the contours the user accepted for this image are used
+    parameters = Slider_VODCA_eng.load_parameters(folder_directory, filename, required=True) if headless else None
+    if not redetect:
+        contours = Cache_VODCA_eng.load_contours(folder_directory, filename, image, parameters)
+        if contours is not None:
+            print(f'saved contours of {len(contours)} droplets are used')
+            return contours
+
+    contours = recognize_contour(image, filename, folder_directory, headless=headless)
+    image = image.replace('\u00B0', "")
+    Cache_VODCA_eng.save_contours(folder_directory, filename, image, contours,
+                                  Slider_VODCA_eng.load_parameters(folder_directory, filename))
+    return contours
+
+
 def write_file(string1, string2, string3, folder, directory):
     """
     writes the strings to a csv file
@@ -200,18 +658,19 @@ def cut_out_temperature(image):
     return None
 
 
-def count_frozen_droplets(image1_file, image2_file, contours, temperature, array_ratio, filename, directory):
+def count_frozen_droplets(image1, image2, contours, temperature, array_ratio, filename, directory, label_map=None,
+                          ratio_store=None, frame_index=None, droplets=None):
     """
     Counts the frozen droplets at a certain temperature
     
     Parameters
     ----------
-    image1_file : str
-        path to the first image
-    image2_file : str
-        path to the second image.
+    image1 : str or numpy array
+        path to the first image or the already decoded BGR image
+    image2 : str or numpy array
+        path to the second image or the already decoded BGR image.
     contours : numpy array
-        contains x, y coordinates and radius of the droplets
+        contains x, y coordinates, radius and mask (1 for liquid droplets, 0 for frozen and excluded droplets)
     temperature : float
         temperature.
     array_ratio : r
@@ -220,6 +679,16 @@ def count_frozen_droplets(image1_file, image2_file, contours, temperature, array
         name of the subfolder.
     directory : str
         path to the folder.
+    label_map : Droplets_VODCA_eng.DropletLabelMap, optional
+        label image of the droplets, if given all droplets are evaluated at once with circular masks
+        instead of cutting out a square for every droplet. The default is None.
+    ratio_store : Droplets_VODCA_eng.RatioStore, optional
+        the ratios of all droplets are saved in it, only used together with label_map. The default is None.
+    frame_index : int, optional
+        index of the first image, the column of the ratio store. The default is None.
+    droplets : numpy array, optional
+        boolean mask of the droplets which changed, see Changes_VODCA_eng.QuiescenceFilter, the other droplets get
+        a ratio of 0. Only used together with label_map. The default is None, all droplets are evaluated.
 
     Returns
     -------
@@ -235,24 +704,47 @@ def count_frozen_droplets(image1_file, image2_file, contours, temperature, array
 
     """
     
-    image1 = cv.cvtColor(np.array(Image.open(image1_file)), cv.COLOR_RGB2BGR)
-    image2 = cv.cvtColor(np.array(Image.open(image2_file)), cv.COLOR_RGB2BGR)
+    # images which are not decoded yet are loaded here
+    if isinstance(image1, str):
+        image1 = Frames_VODCA_eng.load_image(image1)
+    if isinstance(image2, str):
+        image2 = Frames_VODCA_eng.load_image(image2)
     array_ratio.append(temperature)
     list_of_frozen_droplets_radii = [] # ähmmm????!!!!!!!!!!!!!!
 
-    if contours is not None:
+    if contours is not None and label_map is not None:
+        contours = np.around(np.uint64(contours))
+
+        # droplets which are already frozen or not evaluated at all are skipped
+        evaluated = contours[:, 3] == 1
+        if droplets is None:
+            ratios = label_map.ratios(image1, image2)
+        elif droplets.any():
+            ratios = label_map.ratios(image1, image2, droplets)
+        else:
+            # no droplet changed, the images are not read at all
+            ratios = np.zeros(len(contours))
+        array_ratio.extend(ratios[evaluated])
+        if ratio_store is not None:
+            ratio_store.record(frame_index, temperature, ratios)
+
+        # if the sum of differences/Area exceeds a certain value they are detected as frozen.
+        frozen = evaluated & (ratios > 50)
+        n = int(np.count_nonzero(frozen))
+        list_of_frozen_droplets_radii = contours[frozen, 2].astype(int).tolist()
+        contours[frozen, 3] = 0
+
+        array_radius = np.array(list_of_frozen_droplets_radii)/49*15
+        array_radius = np.round(array_radius).astype(int)
+
+    elif contours is not None:
         contours = np.around(np.uint64(contours))
         n = 0
         for pt in contours[:]:
             
-            # unpacks x,y,radius of contours
+            # unpacks x,y,radius of contours, excluded droplets were switched off at the contour detection
             x, y, r, YN = int(pt[0]), int(pt[1]), int(pt[2]), int(pt[3])
-            
-            
-            # cuts out the labelling of the picture in the right corner
-            if r < 48 or (x + r > 1648 and y + r > 1445):
-                YN = 0
-                
+
             if YN:
                 
                # cuts out the droplets of the two images and subtracts them from each other
@@ -0,0 +1,188 @@
+import os
+import sys
+import argparse
+
+
+# the modules are imported by the subcommands, so every subcommand only loads what it needs
+# (matplotlib and pandas take longer to import than most evaluations of a single subfolder)
+
+
+def use_agg_backend():
+    """
+    plots are only saved to files, the environment variable is inherited by the worker processes
+    """
+    os.environ.setdefault('MPLBACKEND', 'Agg')
+
+
+def nm_arguments(args):
+    return {'d': args.d, 'a': args.a, 'b': args.b, 'V_method': args.V_method}
+
+
+def analyse(args):
+    if args.headless:
+        use_agg_backend()
+    import Batch_VODCA_eng
+    vodca = Batch_VODCA_eng.imageanalysis_module()
+
+    if args.watch:
+        vodca.watch_folder(args.folder_directory, args.watch, headless=args.headless, policy=args.policy or 'continue',
+                           prefetch=args.prefetch, checkpoint_every=args.checkpoint_every, output=args.output,
+                           **nm_arguments(args))
+        return 0
+
+    vodca.work_through_folder(args.folder_directory, prefetch=args.prefetch, workers=args.workers,
+                              headless=args.headless, policy=args.policy, redetect=args.redetect,
+                              checkpoint_every=args.checkpoint_every, resume=args.resume, output=args.output,
+                              store_ratios=args.store_ratios, extract=args.extract, timing=args.timing,
+                              progress=args.progress, grayscale=args.grayscale, reduce=args.reduce,
+                              detect_changes=args.detect_changes, skip_quiescent=args.skip_quiescent,
+                              sensitivity=args.sensitivity)
+    if args.evaluate:
+        use_agg_backend()
+        import Auswertung_VODCA_eng
+        Auswertung_VODCA_eng.data_evaluation(args.folder_directory, uncertainty=args.uncertainty,
+                                             **nm_arguments(args))
+    return 0
+
+
+def evaluate(args):
+    use_agg_backend()
+    import Auswertung_VODCA_eng
+    gesamtdaten_Nm = Auswertung_VODCA_eng.data_evaluation(
+        args.paths if len(args.paths) > 1 else args.paths[0], incremental=args.incremental, workers=args.workers,
+        uncertainty=args.uncertainty, n_resamples=args.n_resamples, confidence=args.confidence, **nm_arguments(args))
+    print(f'{len(gesamtdaten_Nm)} temperatures evaluated, saved in '
+          f'overall_evaluation_{os.path.basename(os.path.normpath(args.paths[0]))}.csv')
+    return 0
+
+
+def benchmark(args):
+    use_agg_backend()
+    import Benchmark_VODCA_eng
+    scales = tuple(tuple(int(n) for n in scale.split('x')) for scale in args.scales) or Benchmark_VODCA_eng.SCALES
+    Benchmark_VODCA_eng.run_benchmark(scales, directory=args.directory, seed=args.seed, noise=args.noise,
+                                      drift=args.drift)
+    return 0
+
+
+def inspect(args):
+    import json
+    import numpy as np
+    import Frames_VODCA_eng
+    import Cache_VODCA_eng
+    import Results_VODCA_eng
+    import Timing_VODCA_eng
+
+    folder_directory = args.folder_directory
+    folders = args.folders or sorted(f for f in os.listdir(folder_directory)
+                                     if os.path.isdir(os.path.join(folder_directory, f)))
+    for filename in folders:
+        print('-------------------------------------------------')
+        index = Frames_VODCA_eng.build_frame_index(folder_directory, filename)
+        temperatures = index['temperatures']
+        if len(temperatures):
+            print(f'{filename}: {len(temperatures)} images from {temperatures[0]} to {temperatures[-1]}')
+        else:
+            print(f'{filename}: no images')
+        Frames_VODCA_eng.report_frame_index(index)
+
+        path = Cache_VODCA_eng.contour_cache_path(folder_directory, filename)
+        if os.path.exists(path):
+            with np.load(path) as saved:
+                print(f'saved contours: {len(saved["contours"])} droplets, parameters {saved["parameters"]}')
+        state = Cache_VODCA_eng.load_checkpoint(folder_directory, filename)
+        if state is not None:
+            print(f'checkpoint at {float(state["temperature"])}, '
+                  f'{int(np.count_nonzero(~np.isnan(state["freeze_temperatures"])))} droplets frozen')
+        for path in (Results_VODCA_eng.csv_path(folder_directory, filename),
+                     Results_VODCA_eng.npz_path(folder_directory, filename)):
+            if os.path.exists(path):
+                print(f'results: {os.path.basename(path)}')
+        path = Timing_VODCA_eng.timing_path(folder_directory, filename)
+        if os.path.exists(path):
+            with open(path) as file:
+                report = json.load(file)
+            print(f'last run: {report["wall_time_s"]:.1f} s, {report.get("frames_per_s", 0):.1f} frames/s')
+    print('-------------------------------------------------')
+    return 0
+
+
+def add_nm_arguments(parser):
+    parser.add_argument('--d', type=float, default=1, help='d of the Nm calculation')
+    parser.add_argument('--a', type=float, default=1, help='a of the Nm calculation')
+    parser.add_argument('--b', type=float, default=1, help='b of the Nm calculation')
+    parser.add_argument('--V-method', dest='V_method', choices=('mean', 'individually'), default='mean',
+                        help='volume of the Nm calculation')
+    parser.add_argument('--uncertainty', choices=('bootstrap', 'binomial'),
+                        help='adds confidence intervals of the frozen fraction and Nm')
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='VODCA_eng', description='image analysis of droplet freezing experiments')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    parser_analyse = subparsers.add_parser('analyse', help='counts the frozen droplets of all subfolders')
+    parser_analyse.add_argument('folder_directory', help='main folder with one subfolder of images per experiment')
+    parser_analyse.add_argument('--headless', action='store_true',
+                                help='detects the droplets with the saved parameters, without the interactive window')
+    parser_analyse.add_argument('--policy', choices=('continue', 'skip', 'abort'),
+                                help='answer when lots of droplets freeze at once, instead of asking')
+    parser_analyse.add_argument('--workers', type=int, default=1, help='subfolders evaluated in parallel processes')
+    parser_analyse.add_argument('--prefetch', type=int, default=0, help='images decoded in advance')
+    parser_analyse.add_argument('--redetect', action='store_true', help='ignores the saved contours')
+    parser_analyse.add_argument('--checkpoint-every', type=int, default=50,
+                                help='images between two checkpoints, 0 switches them off')
+    parser_analyse.add_argument('--resume', nargs='?', type=float, const=True, default=False, metavar='TEMPERATURE',
+                                help='resumes at the checkpoint or at the given temperature')
+    parser_analyse.add_argument('--output', choices=('csv', 'npz', 'both'), default='csv')
+    parser_analyse.add_argument('--store-ratios', action='store_true', help='saves the ratios of every droplet')
+    parser_analyse.add_argument('--extract', action='store_true', help='saves the pixels of every droplet')
+    parser_analyse.add_argument('--timing', action='store_true', help='saves timing_<name>.json for every subfolder')
+    parser_analyse.add_argument('--progress', action='store_true', help='prints a progress line for every image')
+    parser_analyse.add_argument('--grayscale', action='store_true', help='low-memory mode with gray images')
+    parser_analyse.add_argument('--reduce', type=int, default=1, choices=(1, 2, 4, 8),
+                                help='decodes the gray images at 1/reduce of their size')
+    parser_analyse.add_argument('--detect-changes', action='store_true',
+                                help='checks every pair of images for a moved sample and changed lighting')
+    parser_analyse.add_argument('--skip-quiescent', action='store_true',
+                                help='evaluates only the droplets which changed according to a coarse score')
+    parser_analyse.add_argument('--sensitivity', type=float, default=0.2,
+                                help='fraction of the threshold the coarse score is compared with')
+    parser_analyse.add_argument('--watch', metavar='FOLDER',
+                                help='analyses this subfolder live while the camera writes the images')
+    parser_analyse.add_argument('--evaluate', action='store_true', help='evaluates the results afterwards')
+    add_nm_arguments(parser_analyse)
+    parser_analyse.set_defaults(function=analyse)
+
+    parser_evaluate = subparsers.add_parser('evaluate', help='calculates the frozen fraction and Nm')
+    parser_evaluate.add_argument('paths', nargs='+', help='folders with the result files, evaluated as one dataset')
+    parser_evaluate.add_argument('--incremental', action='store_true', help='reads only new or changed result files')
+    parser_evaluate.add_argument('--workers', type=int, default=4, help='threads reading the result files')
+    parser_evaluate.add_argument('--n-resamples', type=int, default=10000)
+    parser_evaluate.add_argument('--confidence', type=float, default=0.95)
+    add_nm_arguments(parser_evaluate)
+    parser_evaluate.set_defaults(function=evaluate)
+
+    parser_benchmark = subparsers.add_parser('benchmark', help='benchmarks the pipeline with synthetic images')
+    parser_benchmark.add_argument('--scales', nargs='*', default=[], metavar='DROPLETSxIMAGES',
+                                  help='e.g. 20x30 60x60, the default are the scales of Benchmark_VODCA_eng')
+    parser_benchmark.add_argument('--directory', help='keeps the synthetic images in this folder')
+    parser_benchmark.add_argument('--seed', type=int, default=0)
+    parser_benchmark.add_argument('--noise', type=float, default=3)
+    parser_benchmark.add_argument('--drift', type=float, default=0.0)
+    parser_benchmark.set_defaults(function=benchmark)
+
+    parser_inspect = subparsers.add_parser('inspect', help='shows the images, saved contours and results of subfolders')
+    parser_inspect.add_argument('folder_directory', help='main folder')
+    parser_inspect.add_argument('folders', nargs='*', help='subfolders, the default are all subfolders')
+    parser_inspect.set_defaults(function=inspect)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.function(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())